@@ -1,6 +1,62 @@
-from typing import Any, Dict, List, Optional
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 import anthropic
+import httpx
+import orjson
+
+# Shared clients keyed by API key (and sync/async flavour) so every
+# AIGenerator reuses one connection pool; the Anthropic SDK client is thread-safe
+_CLIENT_CACHE: Dict[Tuple[str, bool], Any] = {}
+_CLIENT_LOCK = threading.Lock()
+_POOL_LIMITS = httpx.Limits(max_keepalive_connections=20, max_connections=50)
+
+# Bound tail latency: fail fast on connect, cap reads well under the SDK's
+# 10-minute default, and let the SDK retry transient errors (connection
+# failures, 429s, 5xx) with jittered exponential backoff
+_REQUEST_TIMEOUT = httpx.Timeout(25.0, connect=3.0, pool=5.0)
+MAX_API_RETRIES = 2
+
+# Upper bound on tool calls executed in parallel within one round
+MAX_TOOL_WORKERS = 8
+
+# Yielded by generate_response_stream in place of a text chunk to retract all
+# text streamed so far: it was a preamble to tool calls (or a reply cut off by
+# an error), not part of the answer
+STREAM_RESET = object()
+
+
+def _get_client(api_key: str, use_async: bool = False):
+    """Return the shared Anthropic client for an API key, creating it once"""
+    key = (api_key, use_async)
+    client = _CLIENT_CACHE.get(key)
+    if client is None:
+        with _CLIENT_LOCK:
+            client = _CLIENT_CACHE.get(key)
+            if client is None:
+                if use_async:
+                    client = anthropic.AsyncAnthropic(
+                        api_key=api_key,
+                        timeout=_REQUEST_TIMEOUT,
+                        max_retries=MAX_API_RETRIES,
+                        http_client=anthropic.DefaultAsyncHttpxClient(
+                            limits=_POOL_LIMITS
+                        ),
+                    )
+                else:
+                    client = anthropic.Anthropic(
+                        api_key=api_key,
+                        timeout=_REQUEST_TIMEOUT,
+                        max_retries=MAX_API_RETRIES,
+                        http_client=anthropic.DefaultHttpxClient(limits=_POOL_LIMITS),
+                    )
+                _CLIENT_CACHE[key] = client
+    return client
 
 
 class AIGenerator:
@@ -36,12 +92,43 @@ All responses must be:
 Provide only the direct answer to what was asked.
 """
 
-    def __init__(self, api_key: str, model: str):
-        self.client = anthropic.Anthropic(api_key=api_key)
+    # One-token classifier prompt used to route queries to the fast model
+    ROUTER_PROMPT = (
+        "Reply with a single letter. Answer Y if the question needs a search of "
+        "the course materials (course content, lessons, outlines, instructors, "
+        "or any topic the courses may teach). Answer N if it is small talk or "
+        "general knowledge that needs no course search."
+    )
+
+    # Maximum number of tool-free responses memoized per generator
+    RESPONSE_CACHE_SIZE = 1024
+
+    def __init__(self, api_key: str, model: str, fast_model: Optional[str] = None):
+        self.client = _get_client(api_key)
+        self.aclient = _get_client(api_key, use_async=True)
         self.model = model
+        # Cheaper model for queries that need no tools; routing is off when unset
+        self.fast_model = fast_model
 
-        # Pre-build base API parameters
-        self.base_params = {"model": self.model, "temperature": 0, "max_tokens": 800}
+        # Pre-build base API parameters; the static system prompt is marked
+        # for prompt caching so repeat calls bill it at the cache-read rate
+        self.base_params = {
+            "model": self.model,
+            "temperature": 0,
+            "max_tokens": 800,
+            "system": [
+                {
+                    "type": "text",
+                    "text": self.SYSTEM_PROMPT,
+                    "cache_control": {"type": "ephemeral"},
+                }
+            ],
+        }
+
+        # temperature=0 makes tool-free answers deterministic, so identical
+        # requests are served from an in-process LRU cache
+        self._exact_cache: "OrderedDict[str, str]" = OrderedDict()
+        self._cache_lock = threading.Lock()
 
     def generate_response(
         self,
@@ -49,6 +136,8 @@ Provide only the direct answer to what was asked.
         conversation_history: Optional[str] = None,
         tools: Optional[List] = None,
         tool_manager=None,
+        sources: Optional[List] = None,
+        route_query: Optional[str] = None,
     ) -> str:
         """
         Generate AI response with optional tool usage and conversation context.
@@ -59,88 +148,71 @@ Provide only the direct answer to what was asked.
             conversation_history: Previous messages for context
             tools: Available tools the AI can use
             tool_manager: Manager to execute tools
+            sources: Optional list that receives the sources of this call's
+                tool runs, in round and block order
+            route_query: The bare user question for the fast-model router;
+                defaults to query, but callers that wrap the question in
+                instructions should pass it unwrapped so the wrapper does not
+                bias the classifier
 
         Returns:
             Generated response as string
         """
 
-        # Build system content efficiently - avoid string ops when possible
-        system_content = (
-            f"{self.SYSTEM_PROMPT}\n\nPrevious conversation:\n{conversation_history}"
-            if conversation_history
-            else self.SYSTEM_PROMPT
+        # Initialize conversation state for sequential rounds
+        messages, cache_key, api_params, final_params = self._prepare_call(
+            query, conversation_history, tools
         )
 
-        # Initialize conversation state for sequential rounds
-        messages = [{"role": "user", "content": query}]
+        # Serve repeated tool-free answers without an API round-trip
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        # Send queries that need no course search to the fast model
+        api_params = self._route(api_params, tools, tool_manager, route_query or query)
+
         max_rounds = 2
 
         # Sequential tool calling loop (up to 2 rounds)
         for current_round in range(1, max_rounds + 1):
-            # Add round context to system prompt for guidance
-            round_system_content = (
-                f"{system_content}\n\n[Round {current_round} of {max_rounds}]"
-            )
-
-            # Prepare API call parameters
-            api_params = {
-                **self.base_params,
-                "messages": messages.copy(),
-                "system": round_system_content,
-            }
-
-            # Add tools if available
-            if tools:
-                api_params["tools"] = tools
-                api_params["tool_choice"] = {"type": "auto"}
-
             try:
                 # Get response from Claude
                 response = self.client.messages.create(**api_params)
+                self._log_cache_usage(response)
+
+                # Skip the tool round when the text Claude sent already answers
+                standalone = self._standalone_text(response, tool_manager)
+                if standalone is not None:
+                    return self._remember(cache_key, current_round, standalone)
 
                 # Handle tool execution if needed
                 if response.stop_reason == "tool_use" and tool_manager:
                     # Execute tools and get results
-                    messages.append({"role": "assistant", "content": response.content})
+                    messages.append(self._assistant_turn(response))
 
                     # Execute all tool calls and collect results
-                    tool_results = []
-                    for content_block in response.content:
-                        if content_block.type == "tool_use":
-                            try:
-                                tool_result = tool_manager.execute_tool(
-                                    content_block.name, **content_block.input
-                                )
-                                tool_results.append(
-                                    {
-                                        "type": "tool_result",
-                                        "tool_use_id": content_block.id,
-                                        "content": tool_result,
-                                    }
-                                )
-                            except Exception as e:
-                                tool_results.append(
-                                    {
-                                        "type": "tool_result",
-                                        "tool_use_id": content_block.id,
-                                        "content": f"Error executing tool: {str(e)}",
-                                    }
-                                )
+                    tool_results, tool_sources = self._run_tools(
+                        tool_manager,
+                        [
+                            content_block
+                            for content_block in response.content
+                            if content_block.type == "tool_use"
+                        ],
+                    )
+                    if sources is not None:
+                        sources.extend(tool_sources)
 
                     if tool_results:
-                        # tool_results is a list of tool result dicts, which is the correct format for Anthropic API
-                        messages.append({"role": "user", "content": tool_results})  # type: ignore
+                        self._append_tool_results(
+                            messages, tool_results, current_round, max_rounds
+                        )
 
                     # If this is the last round, get final response without tools
                     if current_round >= max_rounds:
-                        final_params = {
-                            **self.base_params,
-                            "messages": messages.copy(),
-                            "system": round_system_content,
-                        }
-
                         try:
                             final_response = self.client.messages.create(**final_params)
+                            self._log_cache_usage(final_response)
                             return final_response.content[0].text
                         except Exception as e:
                             return "I gathered some information but encountered an error in final processing."
@@ -152,16 +224,590 @@ Provide only the direct answer to what was asked.
                     if response.stop_reason == "tool_use":
                         return "I was unable to complete the request within the allowed rounds."
                     # Direct response without tools, return immediately
-                    return response.content[0].text
+                    return self._remember(
+                        cache_key, current_round, response.content[0].text
+                    )
 
             except Exception as e:
-                # Handle API errors gracefully
-                if current_round == 1:
-                    # First round failure - return error message
-                    return f"I'm sorry, I encountered an error while processing your request: {str(e)}"
-                else:
-                    # Later round failure - return best effort from previous round
-                    return "I gathered some information but encountered an error in follow-up analysis. Please try rephrasing your question."
+                return self._round_error(current_round, e)
 
         # Fallback - should not reach here due to loop logic, but safety net
         return "I was unable to complete the request within the allowed rounds."
+
+    async def generate_response_async(
+        self,
+        query: str,
+        conversation_history: Optional[str] = None,
+        tools: Optional[List] = None,
+        tool_manager=None,
+        sources: Optional[List] = None,
+        route_query: Optional[str] = None,
+    ) -> str:
+        """
+        Async counterpart of generate_response for use inside the event loop.
+        Tool calls requested in the same round run concurrently.
+
+        Args:
+            query: The user's question or request
+            conversation_history: Previous messages for context
+            tools: Available tools the AI can use
+            tool_manager: Manager to execute tools
+            sources: Optional list that receives the sources of this call's
+                tool runs, in round and block order
+            route_query: The bare user question for the fast-model router;
+                defaults to query, but callers that wrap the question in
+                instructions should pass it unwrapped so the wrapper does not
+                bias the classifier
+
+        Returns:
+            Generated response as string
+        """
+
+        messages, cache_key, api_params, final_params = self._prepare_call(
+            query, conversation_history, tools
+        )
+
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        api_params = await self._route_async(
+            api_params, tools, tool_manager, route_query or query
+        )
+
+        max_rounds = 2
+
+        for current_round in range(1, max_rounds + 1):
+            try:
+                response = await self.aclient.messages.create(**api_params)
+                self._log_cache_usage(response)
+
+                standalone = self._standalone_text(response, tool_manager)
+                if standalone is not None:
+                    return self._remember(cache_key, current_round, standalone)
+
+                if response.stop_reason == "tool_use" and tool_manager:
+                    messages.append(self._assistant_turn(response))
+
+                    # Tools are blocking, so run them in worker threads side by side
+                    tool_results, tool_sources = await self._run_tools_async(
+                        tool_manager,
+                        [
+                            content_block
+                            for content_block in response.content
+                            if content_block.type == "tool_use"
+                        ],
+                    )
+                    if sources is not None:
+                        sources.extend(tool_sources)
+
+                    if tool_results:
+                        self._append_tool_results(
+                            messages, tool_results, current_round, max_rounds
+                        )
+
+                    if current_round >= max_rounds:
+                        try:
+                            final_response = await self.aclient.messages.create(
+                                **final_params
+                            )
+                            self._log_cache_usage(final_response)
+                            return final_response.content[0].text
+                        except Exception as e:
+                            return "I gathered some information but encountered an error in final processing."
+
+                    continue
+                else:
+                    if response.stop_reason == "tool_use":
+                        return "I was unable to complete the request within the allowed rounds."
+                    return self._remember(
+                        cache_key, current_round, response.content[0].text
+                    )
+
+            except Exception as e:
+                return self._round_error(current_round, e)
+
+        return "I was unable to complete the request within the allowed rounds."
+
+    def _prepare_call(
+        self,
+        query: str,
+        conversation_history: Optional[str],
+        tools: Optional[List],
+    ) -> Tuple[List, str, Dict[str, Any], Dict[str, Any]]:
+        """Build the conversation, cache key and request dicts for one call"""
+        system_content = self._build_system(conversation_history)
+        messages = [{"role": "user", "content": query}]
+        cache_key = self._cache_key(system_content, messages, tools)
+
+        # Parameters are identical every round: messages is appended in place
+        # and the system blocks never change, so build the dicts once
+        api_params = {
+            **self.base_params,
+            "messages": messages,
+            "system": system_content,
+        }
+        final_params = api_params
+        if tools:
+            api_params["tools"] = tools
+            api_params["tool_choice"] = {"type": "auto"}
+            # The closing call keeps the same tool schemas, so it reuses the
+            # cached tools+system prefix, but forbids further tool use
+            final_params = {**api_params, "tool_choice": {"type": "none"}}
+
+        return messages, cache_key, api_params, final_params
+
+    def _fast_params(self, api_params: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy request params for the fast model with tools stripped"""
+        params = {
+            key: value
+            for key, value in api_params.items()
+            if key not in ("tools", "tool_choice")
+        }
+        params["model"] = self.fast_model
+        return params
+
+    def _should_route(self, tools: Optional[List], tool_manager) -> bool:
+        """Whether a tool-enabled call should first be classified for routing"""
+        return (
+            bool(tools)
+            and bool(self.fast_model)
+            and self.fast_model != self.model
+            and bool(tool_manager)
+        )
+
+    def _route(
+        self, api_params: Dict[str, Any], tools, tool_manager, route_query: str
+    ) -> Dict[str, Any]:
+        """Classify the question and pick the request params to answer it with"""
+        if not self._should_route(tools, tool_manager):
+            return api_params
+        try:
+            router_response = self.client.messages.create(
+                **self._router_params(route_query)
+            )
+        except Exception:
+            # Routing is best effort; keep the full tool-enabled path
+            return api_params
+        return self._routed_params(api_params, router_response)
+
+    async def _route_async(
+        self, api_params: Dict[str, Any], tools, tool_manager, route_query: str
+    ) -> Dict[str, Any]:
+        """Async counterpart of _route"""
+        if not self._should_route(tools, tool_manager):
+            return api_params
+        try:
+            router_response = await self.aclient.messages.create(
+                **self._router_params(route_query)
+            )
+        except Exception:
+            return api_params
+        return self._routed_params(api_params, router_response)
+
+    def _routed_params(
+        self, api_params: Dict[str, Any], router_response
+    ) -> Dict[str, Any]:
+        """Apply the router's verdict to the request params"""
+        if self._wants_tools(router_response):
+            return api_params
+        return self._fast_params(api_params)
+
+    def _router_params(self, query: str) -> Dict[str, Any]:
+        """Build the one-token classification request for the fast model"""
+        return {
+            "model": self.fast_model,
+            "temperature": 0,
+            "max_tokens": 1,
+            "system": self.ROUTER_PROMPT,
+            "messages": [{"role": "user", "content": query}],
+        }
+
+    @staticmethod
+    def _wants_tools(router_response) -> bool:
+        """Read the classifier verdict, defaulting to the tool-enabled path"""
+        try:
+            verdict = router_response.content[0].text.strip().upper()
+        except (AttributeError, IndexError):
+            return True
+        return not verdict.startswith("N")
+
+    def _cache_key(
+        self, system_content: List[Dict], messages: List, tools: Optional[List]
+    ) -> str:
+        """Hash the full request so only identical calls share a cache entry"""
+        payload = orjson.dumps(
+            {
+                "model": self.model,
+                "system": system_content,
+                "messages": messages,
+                "tools": tools or [],
+            },
+            option=orjson.OPT_SORT_KEYS,
+        )
+        # A 128-bit BLAKE2b digest is plenty for a cache key and cheaper than SHA-256
+        return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+    def _cache_get(self, key: str) -> Optional[str]:
+        """Return a cached response and mark it most recently used"""
+        with self._cache_lock:
+            text = self._exact_cache.get(key)
+            if text is not None:
+                self._exact_cache.move_to_end(key)
+            return text
+
+    def _remember(self, cache_key: str, current_round: int, text: str) -> str:
+        """Cache a first-round answer and hand it back"""
+        if current_round == 1:
+            # No tools ran, so the answer is a pure function of the request
+            self._cache_put(cache_key, text)
+        return text
+
+    def _cache_put(self, key: str, text: str):
+        """Store a response, evicting the least recently used past the limit"""
+        with self._cache_lock:
+            self._exact_cache[key] = text
+            self._exact_cache.move_to_end(key)
+            while len(self._exact_cache) > self.RESPONSE_CACHE_SIZE:
+                self._exact_cache.popitem(last=False)
+
+    async def generate_response_stream(
+        self,
+        query: str,
+        conversation_history: Optional[str] = None,
+        tools: Optional[List] = None,
+        tool_manager=None,
+        sources: Optional[List] = None,
+        route_query: Optional[str] = None,
+    ) -> AsyncIterator[Any]:
+        """
+        Stream the AI response as text deltas while it is generated.
+        Tool rounds run as in generate_response_async. Text is forwarded as it
+        arrives; when a round turns out to be a preamble to tool calls,
+        STREAM_RESET is yielded before the tools run so the consumer can
+        discard what it has shown.
+
+        Args:
+            query: The user's question or request
+            conversation_history: Previous messages for context
+            tools: Available tools the AI can use
+            tool_manager: Manager to execute tools
+            sources: Optional list that receives the sources of this call's
+                tool runs, in round and block order
+            route_query: The bare user question for the fast-model router
+
+        Yields:
+            Chunks of the response text, or STREAM_RESET
+        """
+
+        messages, cache_key, api_params, final_params = self._prepare_call(
+            query, conversation_history, tools
+        )
+
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+
+        api_params = await self._route_async(
+            api_params, tools, tool_manager, route_query or query
+        )
+
+        max_rounds = 2
+
+        for current_round in range(1, max_rounds + 1):
+            streamed = []
+            try:
+                async with self.aclient.messages.stream(**api_params) as stream:
+                    async for text in stream.text_stream:
+                        streamed.append(text)
+                        yield text
+                    response = await stream.get_final_message()
+                self._log_cache_usage(response)
+            except Exception as e:
+                if streamed:
+                    yield STREAM_RESET
+                yield self._round_error(current_round, e)
+                return
+
+            if response.stop_reason != "tool_use":
+                self._remember(cache_key, current_round, "".join(streamed))
+                return
+            # The streamed text already stands alone, so no tool round is needed
+            standalone = self._standalone_text(response, tool_manager)
+            if standalone is not None:
+                self._remember(cache_key, current_round, standalone)
+                return
+            # What streamed was a preamble to the tool calls, not the answer
+            if streamed:
+                yield STREAM_RESET
+            if not tool_manager:
+                yield "I was unable to complete the request within the allowed rounds."
+                return
+
+            messages.append(self._assistant_turn(response))
+            tool_results, tool_sources = await self._run_tools_async(
+                tool_manager,
+                [
+                    content_block
+                    for content_block in response.content
+                    if content_block.type == "tool_use"
+                ],
+            )
+            if sources is not None:
+                sources.extend(tool_sources)
+            if tool_results:
+                self._append_tool_results(
+                    messages, tool_results, current_round, max_rounds
+                )
+
+            if current_round >= max_rounds:
+                streamed = []
+                try:
+                    async with self.aclient.messages.stream(**final_params) as stream:
+                        async for text in stream.text_stream:
+                            streamed.append(text)
+                            yield text
+                        self._log_cache_usage(await stream.get_final_message())
+                except Exception as e:
+                    if streamed:
+                        yield STREAM_RESET
+                    yield "I gathered some information but encountered an error in final processing."
+                return
+
+    def generate_response_batch(self, queries: List[str]) -> List[str]:
+        """
+        Answer many independent queries through the Message Batches API.
+        Intended for offline work (evals, replays) that can wait for results
+        in exchange for half-price tokens; the interactive path is unchanged.
+
+        Args:
+            queries: Questions to answer, each without tools or history
+
+        Returns:
+            Responses in the same order as the queries
+        """
+        return self.batch_generate(self.client, self.model, queries)
+
+    @classmethod
+    def batch_generate(
+        cls,
+        client,
+        model: str,
+        items: List[str],
+        poll_interval: float = 10.0,
+    ) -> List[str]:
+        """
+        Submit queries as one message batch and wait for it to finish.
+
+        Args:
+            client: Anthropic client used to create and poll the batch
+            model: Model to answer every query with
+            items: Questions to answer
+            poll_interval: Seconds between batch status checks
+
+        Returns:
+            Responses in the same order as the items
+        """
+        if not items:
+            return []
+
+        system = [
+            {
+                "type": "text",
+                "text": cls.SYSTEM_PROMPT,
+                "cache_control": {"type": "ephemeral"},
+            }
+        ]
+        batch = client.messages.batches.create(
+            requests=[
+                {
+                    "custom_id": f"q-{i}",
+                    "params": {
+                        "model": model,
+                        "temperature": 0,
+                        "max_tokens": 800,
+                        "system": system,
+                        "messages": [{"role": "user", "content": query}],
+                    },
+                }
+                for i, query in enumerate(items)
+            ]
+        )
+
+        while batch.processing_status != "ended":
+            time.sleep(poll_interval)
+            batch = client.messages.batches.retrieve(batch.id)
+
+        # Results stream back in arbitrary order, so slot them by custom_id
+        responses = ["I was unable to complete the request."] * len(items)
+        for entry in client.messages.batches.results(batch.id):
+            index = int(entry.custom_id.removeprefix("q-"))
+            if entry.result.type == "succeeded":
+                responses[index] = entry.result.message.content[0].text
+            else:
+                responses[index] = (
+                    f"I'm sorry, this batched request did not succeed: "
+                    f"{entry.result.type}"
+                )
+        return responses
+
+    def _build_system(self, conversation_history: Optional[str]) -> List[Dict]:
+        """Build system blocks with history in a trailing uncached block"""
+        # Dynamic context goes after the cached prompt so the cached prefix
+        # stays identical across calls and rounds
+        if not conversation_history:
+            return self.base_params["system"]
+        return [
+            *self.base_params["system"],
+            {
+                "type": "text",
+                "text": f"Previous conversation:\n{conversation_history}",
+            },
+        ]
+
+    @staticmethod
+    def _assistant_turn(response) -> Dict[str, Any]:
+        """Convert a reply to a plain-dict assistant turn for the next round.
+
+        SDK block models would otherwise be re-serialized on every later call;
+        dumping once (dropping unset fields) keeps only what the API needs.
+        """
+        return {
+            "role": "assistant",
+            "content": [
+                block.model_dump(exclude_none=True) for block in response.content
+            ],
+        }
+
+    @staticmethod
+    def _standalone_text(response, tool_manager) -> Optional[str]:
+        """Return text from a tool_use reply when running the tools is pointless.
+
+        That is the case when no tool manager can run them, or when every
+        requested call has empty input; either way the text is the answer.
+        """
+        if response.stop_reason != "tool_use":
+            return None
+        text_blocks = [
+            block.text
+            for block in response.content
+            if getattr(block, "type", None) == "text"
+        ]
+        if not text_blocks:
+            return None
+        tool_blocks = [
+            block
+            for block in response.content
+            if getattr(block, "type", None) == "tool_use"
+        ]
+        if tool_manager is None or all(not block.input for block in tool_blocks):
+            return "".join(text_blocks)
+        return None
+
+    @staticmethod
+    def _run_tool(tool_manager, content_block) -> Tuple[Dict[str, Any], List]:
+        """Execute one tool_use block, returning its tool_result and sources.
+
+        Sources come back with the call rather than from the tools' shared
+        last_sources, so concurrent requests and calls each keep their own.
+        Managers without execute_tool_with_sources report no sources.
+        """
+        execute = getattr(tool_manager, "execute_tool_with_sources", None)
+        try:
+            if execute is not None:
+                tool_result, sources = execute(
+                    content_block.name, **content_block.input
+                )
+            else:
+                tool_result = tool_manager.execute_tool(
+                    content_block.name, **content_block.input
+                )
+                sources = []
+        except Exception as e:
+            tool_result, sources = f"Error executing tool: {str(e)}", []
+        return {
+            "type": "tool_result",
+            "tool_use_id": content_block.id,
+            "content": tool_result,
+        }, sources
+
+    @classmethod
+    def _run_tools(
+        cls, tool_manager, tool_blocks: List
+    ) -> Tuple[List[Dict[str, Any]], List]:
+        """Execute a round's tool calls concurrently, keeping block order.
+
+        Returns the tool_results and the calls' sources merged in block order,
+        so a multi-search round reports the same sources however the threads
+        finish.
+        """
+        if len(tool_blocks) <= 1:
+            outcomes = [cls._run_tool(tool_manager, block) for block in tool_blocks]
+        else:
+            # Tools are I/O bound (vector search), so overlap them in threads
+            with ThreadPoolExecutor(
+                max_workers=min(MAX_TOOL_WORKERS, len(tool_blocks))
+            ) as executor:
+                outcomes = list(
+                    executor.map(
+                        lambda block: cls._run_tool(tool_manager, block), tool_blocks
+                    )
+                )
+        return cls._split_outcomes(outcomes)
+
+    @staticmethod
+    def _split_outcomes(outcomes: List) -> Tuple[List[Dict[str, Any]], List]:
+        """Separate (tool_result, sources) pairs, merging sources in order"""
+        tool_results = [result for result, _ in outcomes]
+        sources = [source for _, call_sources in outcomes for source in call_sources]
+        return tool_results, sources
+
+    @classmethod
+    async def _run_tools_async(
+        cls, tool_manager, tool_blocks: List
+    ) -> Tuple[List[Dict[str, Any]], List]:
+        """Run a round's tool calls in worker threads side by side.
+
+        Returns the tool_results and the calls' sources merged in block order.
+        """
+        outcomes = await asyncio.gather(
+            *(
+                asyncio.to_thread(cls._run_tool, tool_manager, block)
+                for block in tool_blocks
+            )
+        )
+        return cls._split_outcomes(outcomes)
+
+    @staticmethod
+    def _append_tool_results(
+        messages: List, tool_results: List, current_round: int, max_rounds: int
+    ):
+        """Append tool results as the next user turn, tagged with the round"""
+        # Round context rides on the user turn, not the system prompt
+        if current_round < max_rounds:
+            tool_results.append(
+                {
+                    "type": "text",
+                    "text": f"[Round {current_round + 1} of {max_rounds}]",
+                }
+            )
+        # tool_results is a list of tool result dicts, which is the correct format for Anthropic API
+        messages.append({"role": "user", "content": tool_results})  # type: ignore
+
+    @staticmethod
+    def _round_error(current_round: int, error: Exception) -> str:
+        """Map an API failure to a user-facing message for the given round"""
+        if current_round == 1:
+            # First round failure - return error message
+            return f"I'm sorry, I encountered an error while processing your request: {str(error)}"
+        # Later round failure - return best effort from previous round
+        return "I gathered some information but encountered an error in follow-up analysis. Please try rephrasing your question."
+
+    @staticmethod
+    def _log_cache_usage(response) -> None:
+        """Report prompt cache hits so caching can be verified"""
+        usage = getattr(response, "usage", None)
+        cache_read = getattr(usage, "cache_read_input_tokens", None)
+        if isinstance(cache_read, int) and cache_read:
+            print(f"Prompt cache read: {cache_read} input tokens")
@@ -2,15 +2,22 @@ import warnings
 
 warnings.filterwarnings("ignore", message="resource_tracker: There appear to be.*")
 
+import json
 import os
-from typing import Any, Dict, List, Optional, Union
 
 from config import config
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
+from models import (
+    ClearSessionRequest,
+    ClearSessionResponse,
+    CourseStats,
+    QueryRequest,
+    QueryResponse,
+)
 from rag_system import RAGSystem
 
 # Initialize FastAPI app
@@ -33,42 +40,6 @@ app.add_middleware(
 rag_system = RAGSystem(config)
 
 
-# Pydantic models for request/response
-class QueryRequest(BaseModel):
-    """Request model for course queries"""
-
-    query: str
-    session_id: Optional[str] = None
-
-
-class QueryResponse(BaseModel):
-    """Response model for course queries"""
-
-    answer: str
-    sources: List[Union[str, Dict[str, Any]]]  # Support both string and object formats
-    session_id: str
-
-
-class CourseStats(BaseModel):
-    """Response model for course statistics"""
-
-    total_courses: int
-    course_titles: List[str]
-
-
-class ClearSessionRequest(BaseModel):
-    """Request model for clearing a session"""
-
-    session_id: str
-
-
-class ClearSessionResponse(BaseModel):
-    """Response model for session clearing"""
-
-    success: bool
-    message: str
-
-
 # API Endpoints
 
 
@@ -81,14 +52,34 @@ async def query_documents(request: QueryRequest):
         if not session_id:
             session_id = rag_system.session_manager.create_session()
 
-        # Process query using RAG system
-        answer, sources = rag_system.query(request.query, session_id)
+        # Process query using RAG system without blocking the event loop
+        answer, sources = await rag_system.query_async(request.query, session_id)
 
         return QueryResponse(answer=answer, sources=sources, session_id=session_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/query/stream")
+async def query_documents_stream(request: QueryRequest):
+    """Process a query and stream the answer as server-sent events"""
+    # Create session if not provided
+    session_id = request.session_id
+    if not session_id:
+        session_id = rag_system.session_manager.create_session()
+
+    async def event_stream():
+        try:
+            async for event in rag_system.query_stream(request.query, session_id):
+                if event["type"] == "done":
+                    event = {**event, "session_id": session_id}
+                yield f"data: {json.dumps(event)}\n\n"
+        except Exception as e:
+            yield f"data: {json.dumps({'type': 'error', 'detail': str(e)})}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
 @app.get("/api/courses", response_model=CourseStats)
 async def get_course_stats():
     """Get course analytics and statistics"""
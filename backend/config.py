@@ -14,6 +14,7 @@ class Config:
     # Anthropic API settings
     ANTHROPIC_API_KEY: str = os.getenv("ANTHROPIC_API_KEY", "")
     ANTHROPIC_MODEL: str = "claude-sonnet-4-20250514"
+    ANTHROPIC_FAST_MODEL: str = "claude-haiku-4-5-20251001"  # For tool-free queries
 
     # Embedding model settings
     EMBEDDING_MODEL: str = "all-MiniLM-L6-v2"
@@ -1,4 +1,4 @@
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional, Union
 
 from pydantic import BaseModel
 
@@ -27,3 +27,39 @@ class CourseChunk(BaseModel):
     course_title: str  # Which course this chunk belongs to
     lesson_number: Optional[int] = None  # Which lesson this chunk is from
     chunk_index: int  # Position of this chunk in the document
+
+
+# API request/response models
+class QueryRequest(BaseModel):
+    """Request model for course queries"""
+
+    query: str
+    session_id: Optional[str] = None
+
+
+class QueryResponse(BaseModel):
+    """Response model for course queries"""
+
+    answer: str
+    sources: List[Union[str, Dict[str, Any]]]  # Support both string and object formats
+    session_id: str
+
+
+class CourseStats(BaseModel):
+    """Response model for course statistics"""
+
+    total_courses: int
+    course_titles: List[str]
+
+
+class ClearSessionRequest(BaseModel):
+    """Request model for clearing a session"""
+
+    session_id: str
+
+
+class ClearSessionResponse(BaseModel):
+    """Response model for session clearing"""
+
+    success: bool
+    message: str
@@ -1,7 +1,9 @@
+import asyncio
 import os
-from typing import Dict, List, Optional, Tuple
+from functools import partial
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
-from ai_generator import AIGenerator
+from ai_generator import STREAM_RESET, AIGenerator
 from document_processor import DocumentProcessor
 from models import Course, CourseChunk, Lesson
 from search_tools import CourseOutlineTool, CourseSearchTool, ToolManager
@@ -23,7 +25,9 @@ class RAGSystem:
             config.CHROMA_PATH, config.EMBEDDING_MODEL, config.MAX_RESULTS
         )
         self.ai_generator = AIGenerator(
-            config.ANTHROPIC_API_KEY, config.ANTHROPIC_MODEL
+            config.ANTHROPIC_API_KEY,
+            config.ANTHROPIC_MODEL,
+            config.ANTHROPIC_FAST_MODEL,
         )
         self.session_manager = SessionManager(config.MAX_HISTORY)
 
@@ -34,6 +38,10 @@ class RAGSystem:
         self.tool_manager.register_tool(self.search_tool)
         self.tool_manager.register_tool(self.outline_tool)
 
+        # Async queries currently being answered, keyed by (prompt, history),
+        # so identical concurrent requests share one generation
+        self._inflight: Dict[Tuple[str, Optional[str]], asyncio.Task] = {}
+
     def add_course_document(self, file_path: str) -> Tuple[Course, int]:
         """
         Add a single course document to the knowledge base.
@@ -130,37 +138,153 @@ class RAGSystem:
             session_id: Optional session ID for conversation context
 
         Returns:
-            Tuple of (response, sources list - empty for tool-based approach)
+            Tuple of (response, distinct sources of this query's tool calls)
         """
-        # Create prompt for the AI with clear instructions
-        prompt = f"""Answer this question about course materials: {query}"""
-
-        # Get conversation history if session exists
-        history = None
-        if session_id:
-            history = self.session_manager.get_conversation_history(session_id)
+        prompt, history = self._prepare_query(query, session_id)
 
         # Generate response using AI with tools
+        sources = []
         response = self.ai_generator.generate_response(
             query=prompt,
             conversation_history=history,
             tools=self.tool_manager.get_tool_definitions(),
             tool_manager=self.tool_manager,
+            sources=sources,
+            route_query=query,
         )
 
-        # Get sources from the search tool
-        sources = self.tool_manager.get_last_sources()
+        self._record_exchange(query, session_id, response)
+        return response, self._distinct_sources(sources)
 
-        # Reset sources after retrieving them
-        self.tool_manager.reset_sources()
+    async def query_async(
+        self, query: str, session_id: Optional[str] = None
+    ) -> Tuple[str, List[str]]:
+        """
+        Async variant of query that keeps the Claude calls off the event loop.
 
-        # Update conversation history
-        if session_id:
-            self.session_manager.add_exchange(session_id, query, response)
+        Args:
+            query: User's question
+            session_id: Optional session ID for conversation context
+
+        Returns:
+            Tuple of (response, distinct sources of this query's tool calls)
+        """
+        prompt, history = self._prepare_query(query, session_id)
 
-        # Return response with sources from tool searches
+        # Join an identical in-flight request instead of calling Claude again.
+        # The generation runs in its own task, awaited through shield, so a
+        # cancelled caller (e.g. a client disconnect) never cancels it for
+        # the other requests sharing it
+        key = (prompt, history)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._generate_async(query, prompt, history))
+            self._inflight[key] = task
+            task.add_done_callback(partial(self._forget_inflight, key))
+        response, sources = await asyncio.shield(task)
+
+        self._record_exchange(query, session_id, response)
         return response, sources
 
+    async def _generate_async(
+        self, query: str, prompt: str, history: Optional[str]
+    ) -> Tuple[str, List]:
+        """Run one async generation, returning its response and tool sources"""
+        # Sources come back with this generation's own tool calls, so
+        # concurrent requests never read each other's from the tools
+        sources = []
+        response = await self.ai_generator.generate_response_async(
+            query=prompt,
+            conversation_history=history,
+            tools=self.tool_manager.get_tool_definitions(),
+            tool_manager=self.tool_manager,
+            sources=sources,
+            route_query=query,
+        )
+        return response, self._distinct_sources(sources)
+
+    def _forget_inflight(self, key: Tuple[str, Optional[str]], task: asyncio.Task):
+        """Drop a finished generation from the in-flight table"""
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark a failure retrieved even if every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    async def query_stream(
+        self, query: str, session_id: Optional[str] = None
+    ) -> AsyncIterator[Dict]:
+        """
+        Stream a query's answer as events while Claude generates it.
+
+        Args:
+            query: User's question
+            session_id: Optional session ID for conversation context
+
+        Yields:
+            {"type": "delta", "text": ...} events for answer text, then one
+            {"type": "done", "sources": [...]} event once the answer is complete.
+            A {"type": "reset"} event means the text sent so far was a preamble
+            to course searches and should be discarded
+        """
+        prompt, history = self._prepare_query(query, session_id)
+
+        chunks = []
+        sources = []
+        async for text in self.ai_generator.generate_response_stream(
+            query=prompt,
+            conversation_history=history,
+            tools=self.tool_manager.get_tool_definitions(),
+            tool_manager=self.tool_manager,
+            sources=sources,
+            route_query=query,
+        ):
+            if text is STREAM_RESET:
+                # Keep the retracted preamble out of the session history
+                chunks.clear()
+                yield {"type": "reset"}
+                continue
+            chunks.append(text)
+            yield {"type": "delta", "text": text}
+
+        self._record_exchange(query, session_id, "".join(chunks))
+        yield {"type": "done", "sources": self._distinct_sources(sources)}
+
+    def _prepare_query(
+        self, query: str, session_id: Optional[str]
+    ) -> Tuple[str, Optional[str]]:
+        """Build the AI prompt and fetch conversation history for a query"""
+        # Create prompt for the AI with clear instructions
+        prompt = f"""Answer this question about course materials: {query}"""
+
+        # Get conversation history if session exists
+        history = None
+        if session_id:
+            history = self.session_manager.get_conversation_history(session_id)
+
+        return prompt, history
+
+    @staticmethod
+    def _distinct_sources(sources: List) -> List:
+        """Drop repeated sources, keeping each one's first position.
+
+        Every tool call of every round contributes its sources, so a second
+        search over the same lesson would otherwise list it twice.
+        """
+        seen = set()
+        distinct = []
+        for source in sources:
+            key = tuple(sorted(source.items())) if isinstance(source, dict) else source
+            if key not in seen:
+                seen.add(key)
+                distinct.append(source)
+        return distinct
+
+    def _record_exchange(self, query: str, session_id: Optional[str], response: str):
+        """Update conversation history for the session, if any"""
+        if session_id:
+            self.session_manager.add_exchange(session_id, query, response)
+
     def get_course_analytics(self) -> Dict:
         """Get analytics about the course catalog"""
         return {
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Any, Dict, Optional, Protocol
+from typing import Any, Dict, List, Optional, Protocol, Tuple
 
 from vector_store import SearchResults, VectorStore
 
@@ -17,6 +17,40 @@ class Tool(ABC):
         """Execute the tool with given parameters"""
         pass
 
+    def execute_with_sources(self, **kwargs) -> Tuple[str, List[Dict[str, Any]]]:
+        """Execute the tool and return its sources with the result.
+
+        Unlike last_sources, the returned sources belong to this call alone,
+        so concurrent calls on a shared tool cannot see each other's.
+        """
+        return self.execute(**kwargs), []
+
+
+# Tool definitions never change, so each is built once at import and the same
+# dict is handed out on every call; callers must not mutate it
+_SEARCH_TOOL_DEFINITION = {
+    "name": "search_course_content",
+    "description": "Search course materials with smart course name matching and lesson filtering",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "query": {
+                "type": "string",
+                "description": "What to search for in the course content",
+            },
+            "course_name": {
+                "type": "string",
+                "description": "Course title (partial matches work, e.g. 'MCP', 'Introduction')",
+            },
+            "lesson_number": {
+                "type": "integer",
+                "description": "Specific lesson number to search within (e.g. 1, 2, 3)",
+            },
+        },
+        "required": ["query"],
+    },
+}
+
 
 class CourseSearchTool(Tool):
     """Tool for searching course content with semantic course name matching"""
@@ -27,28 +61,7 @@ class CourseSearchTool(Tool):
 
     def get_tool_definition(self) -> Dict[str, Any]:
         """Return Anthropic tool definition for this tool"""
-        return {
-            "name": "search_course_content",
-            "description": "Search course materials with smart course name matching and lesson filtering",
-            "input_schema": {
-                "type": "object",
-                "properties": {
-                    "query": {
-                        "type": "string",
-                        "description": "What to search for in the course content",
-                    },
-                    "course_name": {
-                        "type": "string",
-                        "description": "Course title (partial matches work, e.g. 'MCP', 'Introduction')",
-                    },
-                    "lesson_number": {
-                        "type": "integer",
-                        "description": "Specific lesson number to search within (e.g. 1, 2, 3)",
-                    },
-                },
-                "required": ["query"],
-            },
-        }
+        return _SEARCH_TOOL_DEFINITION
 
     def execute(
         self,
@@ -67,6 +80,24 @@ class CourseSearchTool(Tool):
         Returns:
             Formatted search results or error message
         """
+        result, sources = self.execute_with_sources(query, course_name, lesson_number)
+        if sources:
+            # Store sources for retrieval
+            self.last_sources = sources
+        return result
+
+    def execute_with_sources(
+        self,
+        query: str,
+        course_name: Optional[str] = None,
+        lesson_number: Optional[int] = None,
+    ) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        Search like execute, returning this call's sources instead of storing them.
+
+        Returns:
+            Tuple of (formatted results or error message, sources for the UI)
+        """
 
         # Use the vector store's unified search interface
         results = self.store.search(
@@ -75,7 +106,7 @@ class CourseSearchTool(Tool):
 
         # Handle errors
         if results.error:
-            return results.error
+            return results.error, []
 
         # Handle empty results
         if results.is_empty():
@@ -84,12 +115,14 @@ class CourseSearchTool(Tool):
                 filter_info += f" in course '{course_name}'"
             if lesson_number:
                 filter_info += f" in lesson {lesson_number}"
-            return f"No relevant content found{filter_info}."
+            return f"No relevant content found{filter_info}.", []
 
         # Format and return results
         return self._format_results(results)
 
-    def _format_results(self, results: SearchResults) -> str:
+    def _format_results(
+        self, results: SearchResults
+    ) -> Tuple[str, List[Dict[str, Any]]]:
         """Format search results with course and lesson context"""
         formatted = []
         sources = []  # Track sources for the UI
@@ -120,10 +153,23 @@ class CourseSearchTool(Tool):
 
             formatted.append(f"{header}\n{doc}")
 
-        # Store sources for retrieval
-        self.last_sources = sources
+        return "\n\n".join(formatted), sources
+
 
-        return "\n\n".join(formatted)
+_OUTLINE_TOOL_DEFINITION = {
+    "name": "get_course_outline",
+    "description": "Get complete course outline including lesson list for a specific course",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "course_name": {
+                "type": "string",
+                "description": "Course title (partial matches work, e.g. 'MCP', 'Introduction')",
+            }
+        },
+        "required": ["course_name"],
+    },
+}
 
 
 class CourseOutlineTool(Tool):
@@ -135,20 +181,7 @@ class CourseOutlineTool(Tool):
 
     def get_tool_definition(self) -> Dict[str, Any]:
         """Return Anthropic tool definition for this tool"""
-        return {
-            "name": "get_course_outline",
-            "description": "Get complete course outline including lesson list for a specific course",
-            "input_schema": {
-                "type": "object",
-                "properties": {
-                    "course_name": {
-                        "type": "string",
-                        "description": "Course title (partial matches work, e.g. 'MCP', 'Introduction')",
-                    }
-                },
-                "required": ["course_name"],
-            },
-        }
+        return _OUTLINE_TOOL_DEFINITION
 
     def execute(self, course_name: str) -> str:
         """
@@ -160,18 +193,32 @@ class CourseOutlineTool(Tool):
         Returns:
             Formatted course outline or error message
         """
+        result, sources = self.execute_with_sources(course_name)
+        if sources:
+            self.last_sources = sources
+        return result
+
+    def execute_with_sources(
+        self, course_name: str
+    ) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        Build the outline like execute, returning this call's sources instead.
+
+        Returns:
+            Tuple of (formatted outline or error message, sources for the UI)
+        """
 
         # Resolve course name using vector store's existing method
         resolved_course_title = self.store._resolve_course_name(course_name)
         if not resolved_course_title:
-            return f"No course found matching '{course_name}'"
+            return f"No course found matching '{course_name}'", []
 
         # Get course metadata from the course catalog
         try:
             # Get course by ID (title is the ID)
             results = self.store.course_catalog.get(ids=[resolved_course_title])
             if not results or not results["metadatas"] or not results["metadatas"]:
-                return f"No course metadata found for '{resolved_course_title}'"
+                return f"No course metadata found for '{resolved_course_title}'", []
 
             metadata = results["metadatas"][0]
             course_title = metadata.get("title", resolved_course_title)
@@ -179,7 +226,7 @@ class CourseOutlineTool(Tool):
             lessons_json = metadata.get("lessons_json")
 
             if not lessons_json:
-                return f"No lesson information available for '{course_title}'"
+                return f"No lesson information available for '{course_title}'", []
 
             # Parse lessons data
             import json
@@ -201,12 +248,14 @@ class CourseOutlineTool(Tool):
 
             # Track source for the UI
             source_obj = {"display": course_title, "link": course_link}
-            self.last_sources = [source_obj]
 
-            return "\n".join(outline_parts)
+            return "\n".join(outline_parts), [source_obj]
 
         except Exception as e:
-            return f"Error retrieving course outline for '{course_name}': {str(e)}"
+            return (
+                f"Error retrieving course outline for '{course_name}': {str(e)}",
+                [],
+            )
 
 
 class ToolManager:
@@ -214,6 +263,10 @@ class ToolManager:
 
     def __init__(self):
         self.tools = {}
+        self._tool_definitions = []
+        # Bound execute methods resolved once at registration time
+        self._dispatch = {}
+        self._source_dispatch = {}
 
     def register_tool(self, tool: Tool):
         """Register any tool that implements the Tool interface"""
@@ -222,17 +275,45 @@ class ToolManager:
         if not tool_name:
             raise ValueError("Tool must have a 'name' in its definition")
         self.tools[tool_name] = tool
+        self._dispatch[tool_name] = tool.execute
+        self._source_dispatch[tool_name] = tool.execute_with_sources
+        self._tool_definitions = self._build_tool_definitions()
+
+    def _build_tool_definitions(self) -> list:
+        """Freeze tool definitions, marking the last one for prompt caching"""
+        definitions = [tool.get_tool_definition() for tool in self.tools.values()]
+        if definitions:
+            definitions[-1] = {
+                **definitions[-1],
+                "cache_control": {"type": "ephemeral"},
+            }
+        return definitions
 
     def get_tool_definitions(self) -> list:
-        """Get all tool definitions for Anthropic tool calling"""
-        return [tool.get_tool_definition() for tool in self.tools.values()]
+        """Get all tool definitions for Anthropic tool calling.
+
+        The same list is returned on every call so the cached tool prefix
+        stays byte-identical across rounds and queries; do not mutate it.
+        """
+        return self._tool_definitions
 
     def execute_tool(self, tool_name: str, **kwargs) -> str:
         """Execute a tool by name with given parameters"""
-        if tool_name not in self.tools:
+        execute = self._dispatch.get(tool_name)
+        if execute is None:
             return f"Tool '{tool_name}' not found"
 
-        return self.tools[tool_name].execute(**kwargs)
+        return execute(**kwargs)
+
+    def execute_tool_with_sources(
+        self, tool_name: str, **kwargs
+    ) -> Tuple[str, List[Dict[str, Any]]]:
+        """Execute a tool by name, returning its result and this call's sources"""
+        execute = self._source_dispatch.get(tool_name)
+        if execute is None:
+            return f"Tool '{tool_name}' not found", []
+
+        return execute(**kwargs)
 
     def get_last_sources(self) -> list:
         """Get sources from the last search operation"""
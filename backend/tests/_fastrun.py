@@ -0,0 +1,39 @@
+"""Fast inner-loop smoke check of the API endpoints, without pytest.
+
+Builds the same mock-backed app the API tests use and drives it with a
+TestClient directly, skipping pytest start-up and plugin loading. Run from
+the backend directory with ``python -m tests._fastrun``. CI still runs the
+full pytest suite; this is only for tight edit-and-check loops.
+"""
+
+from fastapi.testclient import TestClient
+from tests.conftest import _build_mock_rag_system, _build_test_app
+
+
+def main():
+    rag_system = _build_mock_rag_system()
+    client = TestClient(_build_test_app(rag_system))
+
+    response = client.get("/")
+    assert response.status_code == 200, response.text
+
+    response = client.post("/api/query", json={"query": "What is machine learning?"})
+    assert response.status_code == 200, response.text
+    assert response.json()["session_id"] == "test-session-123"
+
+    response = client.get("/api/courses")
+    assert response.status_code == 200, response.text
+    assert response.json()["total_courses"] == 3
+
+    response = client.post("/api/session/clear", json={"session_id": "s1"})
+    assert response.status_code == 200, response.text
+    assert response.json()["success"] is True
+
+    response = client.post("/api/query", json={"session_id": "s1"})
+    assert response.status_code == 422, response.text
+
+    print("API smoke checks passed")
+
+
+if __name__ == "__main__":
+    main()
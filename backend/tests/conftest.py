@@ -1,29 +1,43 @@
+import json
 import os
 import shutil
 import sys
 import tempfile
-from pathlib import Path
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from types import SimpleNamespace
 from unittest.mock import MagicMock, Mock, patch
 
 import pytest
-from fastapi.testclient import TestClient
-
-# Add parent directory to Python path for imports (backend modules)
-backend_path = Path(__file__).parent.parent
-sys.path.insert(0, str(backend_path))
-
+import rag_system
+import respx
 from ai_generator import AIGenerator
-from config import Config
-from models import Course, CourseChunk, Lesson
+from config import Config, config
+from fastapi.testclient import TestClient
+from models import (
+    ClearSessionRequest,
+    ClearSessionResponse,
+    Course,
+    CourseChunk,
+    CourseStats,
+    Lesson,
+    QueryRequest,
+    QueryResponse,
+)
 from rag_system import RAGSystem
 from search_tools import CourseOutlineTool, CourseSearchTool, ToolManager
 from vector_store import SearchResults, VectorStore
 
+# Attribute names for the mock specs, computed once at import instead of
+# letting Mock(spec=cls) run dir() over the class on every fixture call
+_CONFIG_SPEC = dir(Config)
+# course_catalog is set in VectorStore.__init__, so it is not on the class
+_VECTOR_STORE_SPEC = [*dir(VectorStore), "course_catalog"]
 
-@pytest.fixture
-def mock_config():
-    """Mock configuration with test values"""
-    config = Mock(spec=Config)
+
+def _fresh_config_mock():
+    """Build a config mock with the test values"""
+    config = Mock(spec=_CONFIG_SPEC)
     config.CHUNK_SIZE = 800
     config.CHUNK_OVERLAP = 100
     config.MAX_RESULTS = 5  # Fixed value instead of 0
@@ -32,56 +46,201 @@ def mock_config():
     config.EMBEDDING_MODEL = "all-MiniLM-L6-v2"
     config.ANTHROPIC_API_KEY = "test-api-key"
     config.ANTHROPIC_MODEL = "claude-sonnet-4-20250514"
+    config.ANTHROPIC_FAST_MODEL = "claude-haiku-4-5-20251001"
     return config
 
 
-@pytest.fixture
-def mock_vector_store():
-    """Mock vector store with controlled responses"""
-    mock_store = Mock(spec=VectorStore)
+# Canned vector store answers, built once and reinstalled before each test.
+# Tuple fields so the shared results can't be appended to by a test.
+_SEARCH_RESULTS = SearchResults(
+    documents=("Test content from course 1", "More content from course 1"),
+    metadata=(
+        {"course_title": "Test Course", "lesson_number": 1, "chunk_index": 0},
+        {"course_title": "Test Course", "lesson_number": 2, "chunk_index": 1},
+    ),
+    distances=(0.1, 0.2),
+)
+_LESSON_LINK = "https://example.com/lesson1"
+_CATALOG_ENTRY = {
+    "metadatas": [
+        {
+            "title": "Test Course",
+            "course_link": "https://example.com/course",
+            "lessons_json": '[{"lesson_number": 1, "lesson_title": "Intro", "lesson_link": "https://example.com/lesson1"}]',
+        }
+    ]
+}
 
+
+def _seed_vector_store(mock_store):
+    """Install the canned vector store responses"""
     # Mock successful search results
-    mock_store.search.return_value = SearchResults(
-        documents=["Test content from course 1", "More content from course 1"],
-        metadata=[
-            {"course_title": "Test Course", "lesson_number": 1, "chunk_index": 0},
-            {"course_title": "Test Course", "lesson_number": 2, "chunk_index": 1},
-        ],
-        distances=[0.1, 0.2],
-    )
+    mock_store.search.return_value = _SEARCH_RESULTS
+
+    # Mock lesson link lookup
+    mock_store.get_lesson_link.return_value = _LESSON_LINK
 
     # Mock course resolution
     mock_store._resolve_course_name.return_value = "Test Course"
 
     # Mock course catalog access
-    mock_catalog = Mock()
-    mock_catalog.get.return_value = {
-        "metadatas": [
-            {
-                "title": "Test Course",
-                "course_link": "https://example.com/course",
-                "lessons_json": '[{"lesson_number": 1, "lesson_title": "Intro", "lesson_link": "https://example.com/lesson1"}]',
-            }
-        ]
-    }
-    mock_store.course_catalog = mock_catalog
+    mock_store.course_catalog.get.return_value = _CATALOG_ENTRY
+
 
+class _CallRecorder:
+    """Plain callable stand-in for a Mock method: canned answer, recorded calls"""
+
+    __slots__ = ("return_value", "side_effect", "calls")
+
+    def __init__(self, return_value=None):
+        self.return_value = return_value
+        self.side_effect = None  # Raised instead of returning when set
+        self.calls = []
+
+    def __call__(self, *args, **kwargs):
+        self.calls.append((args, kwargs))
+        if self.side_effect is not None:
+            raise self.side_effect
+        return self.return_value
+
+
+@dataclass
+class FakeCatalog:
+    """The slice of the Chroma course catalog collection the tools read"""
+
+    get: _CallRecorder = field(default_factory=lambda: _CallRecorder(_CATALOG_ENTRY))
+
+
+@dataclass
+class FakeVectorStore:
+    """Hand-rolled vector store exposing only what the search tools call"""
+
+    search: _CallRecorder = field(
+        default_factory=lambda: _CallRecorder(_SEARCH_RESULTS)
+    )
+    get_lesson_link: _CallRecorder = field(
+        default_factory=lambda: _CallRecorder(_LESSON_LINK)
+    )
+    _resolve_course_name: _CallRecorder = field(
+        default_factory=lambda: _CallRecorder("Test Course")
+    )
+    course_catalog: FakeCatalog = field(default_factory=FakeCatalog)
+
+
+def _profiler_active():
+    """Whether the run is being profiled or measured for coverage"""
+    if os.environ.get("PYTEST_PROFILING") == "1":
+        return True
+    # cProfile (and so pytest-profiling) and coverage's sysmon core register
+    # with sys.monitoring and leave sys.getprofile() unset; older-style
+    # profilers such as MonkeyType still install a setprofile hook
+    monitoring = sys.monitoring
+    return sys.getprofile() is not None or any(
+        monitoring.get_tool(tool_id) is not None
+        for tool_id in (monitoring.PROFILER_ID, monitoring.COVERAGE_ID)
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    """Deselect slow_under_profile tests when a profiler is running.
+
+    Profiler hooks make exception raising disproportionately slow, so these
+    tests are dropped when a sys.monitoring profiler or coverage tool, or a
+    sys.setprofile hook, is active, or when PYTEST_PROFILING=1 is set. They
+    still run everywhere else.
+    """
+    if not _profiler_active():
+        return
+
+    deselected = [item for item in items if "slow_under_profile" in item.keywords]
+    if deselected:
+        config.hook.pytest_deselected(items=deselected)
+        items[:] = [item for item in items if "slow_under_profile" not in item.keywords]
+
+
+@pytest.fixture(autouse=True, scope="session")
+def block_real_http():
+    """Fail fast on any httpx request that a test forgot to mock.
+
+    Routes nothing, so a request that escapes the mocks (e.g. a real
+    Anthropic client call) raises immediately instead of reaching the
+    network. TestClient traffic uses its own transport and is unaffected.
+    """
+    with respx.mock(assert_all_called=False) as router:
+        yield router
+
+
+@pytest.fixture(scope="session")
+def mock_config():
+    """Mock configuration with test values, shared across the session.
+
+    Tests must not mutate it directly; use monkeypatch for overrides.
+    """
+    return _fresh_config_mock()
+
+
+@pytest.fixture(scope="session")
+def real_config():
+    """The application's loaded configuration, for checks against real values"""
+    return config
+
+
+@pytest.fixture(scope="session")
+def session_vector_store():
+    """Vector store mock built once per session; tests use mock_vector_store"""
+    mock_store = Mock(spec_set=_VECTOR_STORE_SPEC)
+    # A plain namespace rather than a child Mock, so catalog calls are only
+    # tracked on get itself and not mirrored into the store's mock_calls
+    mock_store.course_catalog = SimpleNamespace(get=Mock())
     return mock_store
 
 
 @pytest.fixture
+def mock_vector_store(session_vector_store):
+    """Mock vector store with controlled responses, reset for each test"""
+    session_vector_store.reset_mock(return_value=True, side_effect=True)
+    session_vector_store.course_catalog.get.reset_mock(
+        return_value=True, side_effect=True
+    )
+    _seed_vector_store(session_vector_store)
+    return session_vector_store
+
+
+@pytest.fixture
+def fake_vector_store():
+    """Cheap vector store stub for tool tests that need no Mock assertions"""
+    return FakeVectorStore()
+
+
+@pytest.fixture(scope="module")
+def populated_tool_manager():
+    """ToolManager with both course tools registered, built once per module"""
+    store = FakeVectorStore()
+    manager = ToolManager()
+    manager.register_tool(CourseSearchTool(store))
+    manager.register_tool(CourseOutlineTool(store))
+    return manager
+
+
+@pytest.fixture(scope="session")
+def default_search_results():
+    """The two-result search answer the vector store doubles return"""
+    return _SEARCH_RESULTS
+
+
+@pytest.fixture(scope="session")
 def empty_search_results():
     """Empty search results for testing no-results scenarios"""
-    return SearchResults(documents=[], metadata=[], distances=[])
+    return SearchResults(documents=(), metadata=(), distances=())
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def error_search_results():
     """Error search results for testing error scenarios"""
     return SearchResults.empty("Database connection failed")
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_course():
     """Sample course data for testing"""
     lessons = [
@@ -104,7 +263,7 @@ def sample_course():
     )
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_chunks(sample_course):
     """Sample course chunks for testing"""
     return [
@@ -162,44 +321,136 @@ def temp_chroma_db():
     shutil.rmtree(temp_dir)
 
 
-# API Testing Fixtures
+# Collaborators RAGSystem builds in __init__, patched for the integration tests
+_RAG_DEPENDENCIES = (
+    "VectorStore",
+    "AIGenerator",
+    "DocumentProcessor",
+    "SessionManager",
+)
+
+
+@pytest.fixture(scope="module")
+def rag_dependency_patches():
+    """Patch RAGSystem's collaborator classes once per test module"""
+    with ExitStack() as stack:
+        yield {
+            name: stack.enter_context(patch.object(rag_system, name))
+            for name in _RAG_DEPENDENCIES
+        }
+
+
+@pytest.fixture(scope="module")
+def shared_rag_system(rag_dependency_patches, mock_config):
+    """RAGSystem built once per test module on the patched collaborators"""
+    return RAGSystem(mock_config)
 
 
 @pytest.fixture
-def mock_rag_system():
-    """Mock RAG system for API testing"""
-    mock_rag = Mock(spec=RAGSystem)
+def patched_rag(shared_rag_system):
+    """Shared RAGSystem with its collaborator mocks reset, plus a handle to each"""
+    rag = shared_rag_system
+    collaborators = {
+        "vector_store": rag.vector_store,
+        "ai_generator": rag.ai_generator,
+        "document_processor": rag.document_processor,
+        "session_manager": rag.session_manager,
+    }
+    # Forget whatever the previous test configured or recorded
+    for mock_instance in collaborators.values():
+        mock_instance.reset_mock(return_value=True, side_effect=True)
+
+    tool_manager = rag.tool_manager
+    yield SimpleNamespace(rag=rag, **collaborators)
+
+    # Tests swap in their own tool manager; put the real one back
+    rag.tool_manager = tool_manager
+    rag._inflight.clear()
+
 
+# API Testing Fixtures
+
+
+# Canned RAG system answers shared by the mock and the stub
+_SESSION_ID = "test-session-123"
+_QUERY_RESULT = (
+    "This is a test response about the course material.",
+    ["Source 1: Test Course - Lesson 1", "Source 2: Test Course - Lesson 2"],
+)
+_COURSE_ANALYTICS = {
+    "total_courses": 3,
+    "course_titles": ["Course 1", "Course 2", "Course 3"],
+}
+
+
+def _seed_rag_system(mock_rag):
+    """Install the canned RAG system responses the API tests rely on"""
     # Mock session manager
     mock_session_manager = Mock()
-    mock_session_manager.create_session.return_value = "test-session-123"
+    mock_session_manager.create_session.return_value = _SESSION_ID
     mock_session_manager.clear_session.return_value = None
     mock_rag.session_manager = mock_session_manager
 
-    # Mock query response
-    mock_rag.query.return_value = (
-        "This is a test response about the course material.",
-        ["Source 1: Test Course - Lesson 1", "Source 2: Test Course - Lesson 2"],
-    )
+    # Mock query response; the spec makes query_async an AsyncMock
+    mock_rag.query_async.return_value = _QUERY_RESULT
+
+    # Mock streamed query events
+    async def query_stream(query, session_id=None):
+        yield {"type": "delta", "text": "This is a streamed "}
+        yield {"type": "delta", "text": "response."}
+        yield {"type": "done", "sources": ["Source 1: Test Course - Lesson 1"]}
+
+    mock_rag.query_stream.side_effect = query_stream
 
     # Mock course analytics
-    mock_rag.get_course_analytics.return_value = {
-        "total_courses": 3,
-        "course_titles": ["Course 1", "Course 2", "Course 3"],
-    }
+    mock_rag.get_course_analytics.return_value = _COURSE_ANALYTICS
+
 
+def _build_mock_rag_system():
+    """Build a RAG system mock seeded with the canned responses"""
+    mock_rag = Mock(spec=RAGSystem)
+    _seed_rag_system(mock_rag)
     return mock_rag
 
 
+@pytest.fixture(scope="session")
+def mock_rag_system():
+    """Mock RAG system for API testing, shared by the session-scoped app"""
+    return _build_mock_rag_system()
+
+
+@pytest.fixture(autouse=True)
+def reset_mock_rag_system(mock_rag_system):
+    """Undo per-test overrides on the shared RAG mock and restore its canned returns"""
+    mock_rag_system.reset_mock(return_value=True, side_effect=True)
+    _seed_rag_system(mock_rag_system)
+
+
 @pytest.fixture
-def test_app(mock_rag_system):
-    """Create a test FastAPI app without static file mounting issues"""
-    from typing import Any, Dict, List, Optional, Union
+def stub_rag_system(test_app, monkeypatch):
+    """Plain canned-answer RAG system for API tests that make no call assertions"""
+
+    async def query_async(query, session_id=None):
+        return _QUERY_RESULT
+
+    stub = SimpleNamespace(
+        query_async=query_async,
+        get_course_analytics=lambda: _COURSE_ANALYTICS,
+        session_manager=SimpleNamespace(
+            create_session=lambda: _SESSION_ID,
+            clear_session=lambda session_id: None,
+        ),
+    )
+    monkeypatch.setattr(test_app.state, "rag_system", stub)
+    return stub
 
+
+def _build_test_app(rag_system):
+    """Create a test FastAPI app without static file mounting issues"""
     from fastapi import FastAPI, HTTPException
     from fastapi.middleware.cors import CORSMiddleware
     from fastapi.middleware.trustedhost import TrustedHostMiddleware
-    from pydantic import BaseModel
+    from fastapi.responses import StreamingResponse
 
     # Create test app with same structure as main app but without static files
     app = FastAPI(title="Course Materials RAG System Test", root_path="")
@@ -217,28 +468,7 @@ def test_app(mock_rag_system):
     )
 
     # Set the mock RAG system
-    app.state.rag_system = mock_rag_system
-
-    # Pydantic models (copied from main app)
-    class QueryRequest(BaseModel):
-        query: str
-        session_id: Optional[str] = None
-
-    class QueryResponse(BaseModel):
-        answer: str
-        sources: List[Union[str, Dict[str, Any]]]
-        session_id: str
-
-    class CourseStats(BaseModel):
-        total_courses: int
-        course_titles: List[str]
-
-    class ClearSessionRequest(BaseModel):
-        session_id: str
-
-    class ClearSessionResponse(BaseModel):
-        success: bool
-        message: str
+    app.state.rag_system = rag_system
 
     # API endpoints (copied from main app)
     @app.post("/api/query", response_model=QueryResponse)
@@ -249,12 +479,30 @@ def test_app(mock_rag_system):
             if not session_id:
                 session_id = rag_system.session_manager.create_session()
 
-            answer, sources = rag_system.query(request.query, session_id)
+            answer, sources = await rag_system.query_async(request.query, session_id)
 
             return QueryResponse(answer=answer, sources=sources, session_id=session_id)
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
 
+    @app.post("/api/query/stream")
+    async def query_documents_stream(request: QueryRequest):
+        rag_system = app.state.rag_system
+        session_id = request.session_id
+        if not session_id:
+            session_id = rag_system.session_manager.create_session()
+
+        async def event_stream():
+            try:
+                async for event in rag_system.query_stream(request.query, session_id):
+                    if event["type"] == "done":
+                        event = {**event, "session_id": session_id}
+                    yield f"data: {json.dumps(event)}\n\n"
+            except Exception as e:
+                yield f"data: {json.dumps({'type': 'error', 'detail': str(e)})}\n\n"
+
+        return StreamingResponse(event_stream(), media_type="text/event-stream")
+
     @app.get("/api/courses", response_model=CourseStats)
     async def get_course_stats():
         try:
@@ -286,25 +534,35 @@ def test_app(mock_rag_system):
     return app
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
+def test_app(mock_rag_system):
+    """Test FastAPI app backed by the shared RAG system mock"""
+    return _build_test_app(mock_rag_system)
+
+
+@pytest.fixture(scope="session")
 def test_client(test_app):
     """Create test client for API testing"""
     return TestClient(test_app)
 
 
-@pytest.fixture
+# Request bodies are only serialized by the client, never mutated, so one
+# copy of each serves the whole session
+
+
+@pytest.fixture(scope="session")
 def sample_query_request():
     """Sample query request data for API testing"""
-    return {"query": "What is machine learning?", "session_id": "test-session-123"}
+    return {"query": "What is machine learning?", "session_id": _SESSION_ID}
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_query_request_no_session():
     """Sample query request without session ID"""
     return {"query": "Explain neural networks"}
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_clear_session_request():
     """Sample clear session request data"""
-    return {"session_id": "test-session-123"}
+    return {"session_id": _SESSION_ID}
@@ -1,124 +1,322 @@
-import sys
-from pathlib import Path
-from unittest.mock import MagicMock, Mock, patch
-
+import asyncio
+import re
+import time
+from dataclasses import asdict, dataclass
+from operator import itemgetter
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock, call, patch
+
+import ai_generator
 import pytest
-
-# Add parent directory to path
-backend_path = Path(__file__).parent.parent
-sys.path.insert(0, str(backend_path))
-
-from ai_generator import AIGenerator
+from ai_generator import STREAM_RESET, AIGenerator
+
+# The prompt is a constant, so its key components are matched in one pass
+_PROMPT = AIGenerator.SYSTEM_PROMPT
+_NEEDLES = {
+    "course materials",
+    "search_course_content",
+    "get_course_outline",
+    "tool",
+    "brief",
+    "concise",
+}
+# Longest first so no needle is shadowed by a shorter alternative
+_NEEDLE_RE = re.compile(
+    "|".join(map(re.escape, sorted(_NEEDLES, key=len, reverse=True))), re.I
+)
+
+# Pulls the request fields most assertions inspect in a single call
+_GET = itemgetter("model", "messages", "system")
+
+# Keep the module on one worker under `pytest -n auto --dist loadgroup` so its
+# class-scoped Anthropic client patches are set up once per run rather than
+# once on every worker that picks up a few of its tests. Workers are separate
+# processes, so this only saves setup; the patches can't interfere across them
+pytestmark = pytest.mark.xdist_group("ai_generator")
+
+
+@dataclass(slots=True)
+class ToolBlock:
+    """Lightweight stand-in for the SDK's ToolUseBlock"""
+
+    type: str
+    name: str
+    input: dict
+    id: str
+
+    def model_dump(self, exclude_none=False):
+        return asdict(self)
+
+
+def resp(text=None, blocks=None, stop="end_turn"):
+    """Build a response object carrying either one text block or the given blocks"""
+    return SimpleNamespace(
+        content=blocks or [SimpleNamespace(text=text)], stop_reason=stop
+    )
+
+
+def tool_use(name, input_, id_="tool_123"):
+    """Build a tool_use response requesting a single tool call"""
+    return resp(blocks=[ToolBlock("tool_use", name, input_, id_)], stop="tool_use")
+
+
+_OUTLINE_CALL = tool_use("get_course_outline", {"course_name": "MCP"}, "tool_123")
+_SEARCH_CALL = tool_use(
+    "search_course_content", {"query": "lesson 4", "course_name": "MCP"}, "tool_456"
+)
+
+# (id, API responses, tool results, answer, expected tool calls, last tool_choice)
+SEQ_CASES = [
+    (
+        "two_rounds",
+        [
+            _OUTLINE_CALL,
+            _SEARCH_CALL,
+            resp("Final response with comprehensive info"),
+        ],
+        ["Course outline result", "Search content result"],
+        "Final response with comprehensive info",
+        [
+            call("get_course_outline", course_name="MCP"),
+            call("search_course_content", query="lesson 4", course_name="MCP"),
+        ],
+        {"type": "none"},
+    ),
+    (
+        "early_termination",
+        [
+            _OUTLINE_CALL,
+            resp("Complete response after first tool"),
+        ],
+        ["Course outline result"],
+        "Complete response after first tool",
+        [call("get_course_outline", course_name="MCP")],
+        {"type": "auto"},
+    ),
+    (
+        "max_rounds_reached",
+        [
+            _SEARCH_CALL,
+            _SEARCH_CALL,
+            resp("Final response after max rounds"),
+        ],
+        ["Tool result", "Tool result"],
+        "Final response after max rounds",
+        [call("search_course_content", query="lesson 4", course_name="MCP")] * 2,
+        {"type": "none"},
+    ),
+]
+
+
+class FakeMessageStream:
+    """Async context manager standing in for client.messages.stream()"""
+
+    def __init__(self, texts, final_message):
+        self.texts = texts
+        self.final_message = final_message
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    @property
+    async def text_stream(self):
+        for text in self.texts:
+            yield text
+
+    async def get_final_message(self):
+        return self.final_message
+
+
+async def collect_stream(stream):
+    """Drain an async text stream into a list"""
+    return [chunk async for chunk in stream]
+
+
+@pytest.fixture(autouse=True)
+def clear_client_cache():
+    """Drop shared Anthropic clients so each test sees its own patched client"""
+    ai_generator._CLIENT_CACHE.clear()
+    yield
+    ai_generator._CLIENT_CACHE.clear()
+
+
+@pytest.fixture(scope="class")
+def mock_anthropic_class():
+    """Patch the sync Anthropic client class once for the whole test class"""
+    with patch("ai_generator.anthropic.Anthropic") as mock_class:
+        yield mock_class
+
+
+@pytest.fixture(scope="class")
+def mock_async_anthropic_class():
+    """Patch the async Anthropic client class once for the whole test class"""
+    with patch("ai_generator.anthropic.AsyncAnthropic") as mock_class:
+        yield mock_class
+
+
+@pytest.fixture(autouse=True)
+def mock_client(mock_anthropic_class, mock_async_anthropic_class):
+    """Shared sync client mock, cleared of the previous test's configuration"""
+    for mock_class in (mock_anthropic_class, mock_async_anthropic_class):
+        mock_class.return_value.reset_mock(return_value=True, side_effect=True)
+        mock_class.reset_mock()
+    return mock_anthropic_class.return_value
+
+
+@pytest.fixture
+def mock_async_client(mock_async_anthropic_class):
+    """Shared async client mock; tests install AsyncMock methods as needed"""
+    return mock_async_anthropic_class.return_value
+
+
+@pytest.fixture
+def generator(mock_client):
+    """AIGenerator wired to the shared patched clients"""
+    return AIGenerator("test-api-key", "claude-sonnet-4-20250514")
+
+
+@pytest.fixture
+def tool_manager():
+    """Tool manager mock limited to the one method AIGenerator calls"""
+    return Mock(spec=["execute_tool"])
 
 
 class TestAIGenerator:
     """Test AIGenerator functionality"""
 
-    def test_init(self):
-        """Test AIGenerator initialization"""
-        generator = AIGenerator("test-api-key", "claude-sonnet-4-20250514")
+    # Read-only single-turn reply shared by the tests that only need some text
+    _SIMPLE_RESP = SimpleNamespace(
+        content=(SimpleNamespace(text="This is a test response"),),
+        stop_reason="end_turn",
+    )
 
+    def test_init(self, generator):
+        """Test AIGenerator initialization"""
         assert generator.model == "claude-sonnet-4-20250514"
         assert generator.base_params["model"] == "claude-sonnet-4-20250514"
         assert generator.base_params["temperature"] == 0
         assert generator.base_params["max_tokens"] == 800
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_generate_response_simple(self, mock_anthropic_class):
-        """Test simple response generation without tools"""
-        # Setup mock client
-        mock_client = Mock()
-        mock_anthropic_class.return_value = mock_client
+    def test_client_shared_per_api_key(self, mock_anthropic_class):
+        """Test generators with the same API key reuse one pooled client"""
+        first = AIGenerator("test-api-key", "claude-sonnet-4-20250514")
+        second = AIGenerator("test-api-key", "claude-sonnet-4-20250514")
+        other = AIGenerator("other-api-key", "claude-sonnet-4-20250514")
 
-        # Setup mock response
-        mock_response = Mock()
-        mock_response.content = [Mock(text="This is a test response")]
-        mock_response.stop_reason = "end_turn"
-        mock_client.messages.create.return_value = mock_response
+        assert first.client is second.client
+        assert mock_anthropic_class.call_count == 2
+
+        # Requests are bounded by explicit timeouts and a small retry budget
+        client_kwargs = mock_anthropic_class.call_args.kwargs
+        assert client_kwargs["timeout"].connect == 3.0
+        assert client_kwargs["timeout"].read == 25.0
+        assert client_kwargs["max_retries"] == ai_generator.MAX_API_RETRIES
+        assert other.client is not None
+
+    def test_generate_response_simple(self, mock_client, generator):
+        """Test simple response generation without tools"""
+        mock_client.messages.create.return_value = self._SIMPLE_RESP
 
-        generator = AIGenerator("test-api-key", "claude-sonnet-4-20250514")
         result = generator.generate_response("What is AI?")
 
         assert result == "This is a test response"
 
         # Verify API call
         mock_client.messages.create.assert_called_once()
-        call_args = mock_client.messages.create.call_args[1]
-        assert call_args["model"] == "claude-sonnet-4-20250514"
-        assert call_args["messages"][0]["content"] == "What is AI?"
-        assert AIGenerator.SYSTEM_PROMPT in call_args["system"]
+        model, messages, system = _GET(mock_client.messages.create.call_args.kwargs)
+        assert model == "claude-sonnet-4-20250514"
+        assert messages[0]["content"] == "What is AI?"
+        assert system[0]["text"] == AIGenerator.SYSTEM_PROMPT
+        assert system[0]["cache_control"] == {"type": "ephemeral"}
+
+    def test_generate_response_cached_for_repeat_query(self, mock_client, generator):
+        """Test identical tool-free requests are served from the response cache"""
+        mock_response = resp("Cached response")
+        mock_client.messages.create.return_value = mock_response
+
+        assert generator.generate_response("What is AI?") == "Cached response"
+        assert generator.generate_response("What is AI?") == "Cached response"
+        mock_client.messages.create.assert_called_once()
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_generate_response_with_history(self, mock_anthropic_class):
-        """Test response generation with conversation history"""
-        mock_client = Mock()
-        mock_anthropic_class.return_value = mock_client
+        # Different history is a different request
+        generator.generate_response("What is AI?", conversation_history="Earlier")
+        assert mock_client.messages.create.call_count == 2
 
-        mock_response = Mock()
-        mock_response.content = [Mock(text="Response with context")]
-        mock_response.stop_reason = "end_turn"
-        mock_client.messages.create.return_value = mock_response
+    def test_tool_responses_not_cached(self, mock_client, generator, tool_manager):
+        """Test answers that depended on tool results are never memoized"""
+        mock_tool_response = tool_use(
+            "search_course_content", {"query": "test"}, "tool_123"
+        )
+
+        mock_final_response = resp("Tool based answer")
+
+        mock_client.messages.create.side_effect = [
+            mock_tool_response,
+            mock_final_response,
+        ] * 2
+
+        tool_manager.execute_tool.return_value = "Tool result"
+
+        for _ in range(2):
+            generator.generate_response(
+                "Search query",
+                tools=[{"name": "search_course_content"}],
+                tool_manager=tool_manager,
+            )
+
+        assert mock_client.messages.create.call_count == 4
+        assert generator._exact_cache == {}
+
+    def test_generate_response_with_history(self, mock_client, generator):
+        """Test response generation with conversation history"""
+        mock_client.messages.create.return_value = self._SIMPLE_RESP
 
-        generator = AIGenerator("test-api-key", "claude-sonnet-4-20250514")
         result = generator.generate_response(
             "Follow up question", conversation_history="Previous conversation context"
         )
 
-        assert result == "Response with context"
+        assert result == "This is a test response"
 
-        # Verify history was included in system prompt
-        call_args = mock_client.messages.create.call_args[1]
-        assert "Previous conversation context" in call_args["system"]
+        # Verify history was included in the uncached system block
+        _, _, system = _GET(mock_client.messages.create.call_args.kwargs)
+        assert "Previous conversation context" in system[-1]["text"]
+        assert "cache_control" not in system[-1]
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_generate_response_with_tools_no_use(self, mock_anthropic_class):
+    def test_generate_response_with_tools_no_use(
+        self, mock_client, generator, tool_manager
+    ):
         """Test response generation with tools available but not used"""
-        mock_client = Mock()
-        mock_anthropic_class.return_value = mock_client
-
-        mock_response = Mock()
-        mock_response.content = [Mock(text="Direct response without tools")]
-        mock_response.stop_reason = "end_turn"
-        mock_client.messages.create.return_value = mock_response
+        mock_client.messages.create.return_value = self._SIMPLE_RESP
 
         mock_tools = [{"name": "test_tool", "description": "Test tool"}]
-        mock_tool_manager = Mock()
-
-        generator = AIGenerator("test-api-key", "claude-sonnet-4-20250514")
         result = generator.generate_response(
-            "What is AI?", tools=mock_tools, tool_manager=mock_tool_manager
+            "What is AI?", tools=mock_tools, tool_manager=tool_manager
         )
 
-        assert result == "Direct response without tools"
+        assert result == "This is a test response"
 
         # Verify tools were provided in API call
-        call_args = mock_client.messages.create.call_args[1]
+        call_args = mock_client.messages.create.call_args.kwargs
         assert call_args["tools"] == mock_tools
         assert call_args["tool_choice"] == {"type": "auto"}
 
         # Tool manager should not be called
-        mock_tool_manager.execute_tool.assert_not_called()
+        tool_manager.execute_tool.assert_not_called()
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_generate_response_with_tool_use(self, mock_anthropic_class):
+    def test_generate_response_with_tool_use(
+        self, mock_client, generator, tool_manager
+    ):
         """Test response generation with tool execution"""
-        mock_client = Mock()
-        mock_anthropic_class.return_value = mock_client
-
         # First response triggers tool use
-        mock_tool_block = Mock()
-        mock_tool_block.type = "tool_use"
-        mock_tool_block.name = "search_course_content"
-        mock_tool_block.input = {"query": "test query"}
-        mock_tool_block.id = "tool_123"
-
-        mock_initial_response = Mock()
-        mock_initial_response.content = [mock_tool_block]
-        mock_initial_response.stop_reason = "tool_use"
+        mock_initial_response = tool_use(
+            "search_course_content", {"query": "test query"}, "tool_123"
+        )
 
         # Final response after tool execution
-        mock_final_response = Mock()
-        mock_final_response.content = [Mock(text="Response using tool results")]
+        mock_final_response = resp("Response using tool results")
 
         # Configure mock client to return different responses
         mock_client.messages.create.side_effect = [
@@ -127,53 +325,115 @@ class TestAIGenerator:
         ]
 
         # Setup mock tool manager
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.return_value = "Tool execution result"
+        tool_manager.execute_tool.return_value = "Tool execution result"
 
         mock_tools = [{"name": "search_course_content", "description": "Search tool"}]
 
-        generator = AIGenerator("test-api-key", "claude-sonnet-4-20250514")
         result = generator.generate_response(
             "Search for information about AI",
             tools=mock_tools,
-            tool_manager=mock_tool_manager,
+            tool_manager=tool_manager,
         )
 
         assert result == "Response using tool results"
 
         # Verify tool was executed
-        mock_tool_manager.execute_tool.assert_called_once_with(
+        tool_manager.execute_tool.assert_called_once_with(
             "search_course_content", query="test query"
         )
 
         # Verify two API calls were made
         assert mock_client.messages.create.call_count == 2
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_handle_tool_execution_multiple_tools(self, mock_anthropic_class):
-        """Test handling multiple tool calls in one response"""
-        mock_client = Mock()
-        mock_anthropic_class.return_value = mock_client
+    def test_general_query_routed_to_fast_model(self, mock_client, tool_manager):
+        """Test the router sends tool-free questions to the fast model"""
+        mock_router_response = resp("N")
+
+        mock_response = resp("Paris")
+
+        mock_client.messages.create.side_effect = [mock_router_response, mock_response]
+
+        generator = AIGenerator(
+            "test-api-key", "claude-sonnet-4-20250514", "claude-haiku-4-5-20251001"
+        )
+        result = generator.generate_response(
+            "What is the capital of France?",
+            tools=[{"name": "search_course_content"}],
+            tool_manager=tool_manager,
+        )
 
+        assert result == "Paris"
+        router_args, answer_args = [
+            c.kwargs for c in mock_client.messages.create.call_args_list
+        ]
+        assert router_args["model"] == "claude-haiku-4-5-20251001"
+        assert router_args["max_tokens"] == 1
+        assert answer_args["model"] == "claude-haiku-4-5-20251001"
+        assert "tools" not in answer_args
+
+    def test_router_classifies_the_bare_question(self, mock_client, tool_manager):
+        """Test the router sees route_query, not the wrapped answer prompt"""
+        mock_client.messages.create.side_effect = [resp("N"), resp("Paris")]
+
+        generator = AIGenerator(
+            "test-api-key", "claude-sonnet-4-20250514", "claude-haiku-4-5-20251001"
+        )
+        generator.generate_response(
+            "Answer this question about course materials: Capital of France?",
+            tools=[{"name": "search_course_content"}],
+            tool_manager=tool_manager,
+            route_query="Capital of France?",
+        )
+
+        router_args, answer_args = [
+            c.kwargs for c in mock_client.messages.create.call_args_list
+        ]
+        assert router_args["messages"] == [
+            {"role": "user", "content": "Capital of France?"}
+        ]
+        # The answering call still gets the full prompt
+        assert answer_args["messages"][0]["content"].startswith("Answer this")
+
+    def test_course_query_keeps_primary_model(self, mock_client, tool_manager):
+        """Test queries the router flags for search keep the tool-enabled model"""
+        mock_router_response = resp("Y")
+
+        mock_response = resp("Course answer")
+
+        mock_client.messages.create.side_effect = [mock_router_response, mock_response]
+
+        generator = AIGenerator(
+            "test-api-key", "claude-sonnet-4-20250514", "claude-haiku-4-5-20251001"
+        )
+        result = generator.generate_response(
+            "What does lesson 2 of the MCP course cover?",
+            tools=[{"name": "search_course_content"}],
+            tool_manager=tool_manager,
+        )
+
+        assert result == "Course answer"
+        answer_args = mock_client.messages.create.call_args_list[1].kwargs
+        assert answer_args["model"] == "claude-sonnet-4-20250514"
+        assert answer_args["tools"][0]["name"] == "search_course_content"
+
+    def test_handle_tool_execution_multiple_tools(
+        self, mock_client, generator, tool_manager
+    ):
+        """Test handling multiple tool calls in one response"""
         # Create multiple tool blocks
-        mock_tool_block1 = Mock()
-        mock_tool_block1.type = "tool_use"
-        mock_tool_block1.name = "search_course_content"
-        mock_tool_block1.input = {"query": "test query 1"}
-        mock_tool_block1.id = "tool_123"
+        mock_tool_block1 = ToolBlock(
+            "tool_use", "search_course_content", {"query": "test query 1"}, "tool_123"
+        )
 
-        mock_tool_block2 = Mock()
-        mock_tool_block2.type = "tool_use"
-        mock_tool_block2.name = "get_course_outline"
-        mock_tool_block2.input = {"course_name": "Test Course"}
-        mock_tool_block2.id = "tool_456"
+        mock_tool_block2 = ToolBlock(
+            "tool_use", "get_course_outline", {"course_name": "Test Course"}, "tool_456"
+        )
 
-        mock_initial_response = Mock()
-        mock_initial_response.content = [mock_tool_block1, mock_tool_block2]
-        mock_initial_response.stop_reason = "tool_use"
+        mock_initial_response = resp(
+            blocks=[mock_tool_block1, mock_tool_block2], stop="tool_use"
+        )
 
-        mock_final_response = Mock()
-        mock_final_response.content = [Mock(text="Combined tool results")]
+        mock_final_response = resp("Combined tool results")
 
         mock_client.messages.create.side_effect = [
             mock_initial_response,
@@ -181,61 +441,134 @@ class TestAIGenerator:
         ]
 
         # Setup mock tool manager
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.side_effect = ["Search result", "Outline result"]
+        tool_manager.execute_tool.side_effect = ["Search result", "Outline result"]
 
-        generator = AIGenerator("test-api-key", "claude-sonnet-4-20250514")
         result = generator.generate_response(
-            "Complex query", tools=[], tool_manager=mock_tool_manager
+            "Complex query", tools=[], tool_manager=tool_manager
         )
 
         assert result == "Combined tool results"
 
         # Verify both tools were executed
-        assert mock_tool_manager.execute_tool.call_count == 2
-        mock_tool_manager.execute_tool.assert_any_call(
+        assert tool_manager.execute_tool.call_count == 2
+        tool_manager.execute_tool.assert_any_call(
             "search_course_content", query="test query 1"
         )
-        mock_tool_manager.execute_tool.assert_any_call(
+        tool_manager.execute_tool.assert_any_call(
             "get_course_outline", course_name="Test Course"
         )
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_handle_tool_execution_message_flow(self, mock_anthropic_class):
-        """Test proper message flow during tool execution"""
-        mock_client = Mock()
-        mock_anthropic_class.return_value = mock_client
+    def test_assistant_turn_uses_plain_dicts(self):
+        """Test assistant turns are stored as plain dicts without unset fields"""
+        from anthropic.types import TextBlock, ToolUseBlock
+
+        response = SimpleNamespace(
+            content=[
+                TextBlock(type="text", text="Let me look that up"),
+                ToolUseBlock(
+                    type="tool_use",
+                    id="tool_123",
+                    name="search_course_content",
+                    input={"query": "test"},
+                ),
+            ]
+        )
 
-        # Setup tool use scenario
-        mock_tool_block = Mock()
-        mock_tool_block.type = "tool_use"
-        mock_tool_block.name = "test_tool"
-        mock_tool_block.input = {"param": "value"}
-        mock_tool_block.id = "tool_123"
+        turn = AIGenerator._assistant_turn(response)
+
+        assert turn == {
+            "role": "assistant",
+            "content": [
+                {"type": "text", "text": "Let me look that up"},
+                {
+                    "type": "tool_use",
+                    "id": "tool_123",
+                    "name": "search_course_content",
+                    "input": {"query": "test"},
+                },
+            ],
+        }
+
+    def test_run_tools_preserves_order_and_isolates_errors(self, tool_manager):
+        """Test parallel tool execution keeps block order and per-tool errors"""
+        blocks = [
+            ToolBlock("tool_use", name, {}, tool_id)
+            for tool_id, name in [("tool_1", "fails"), ("tool_2", "works")]
+        ]
+
+        def execute_tool(name, **kwargs):
+            if name == "fails":
+                raise RuntimeError("boom")
+            return f"{name} result"
+
+        tool_manager.execute_tool.side_effect = execute_tool
 
-        mock_initial_response = Mock()
-        mock_initial_response.content = [mock_tool_block]
-        mock_initial_response.stop_reason = "tool_use"
+        results, sources = AIGenerator._run_tools(tool_manager, blocks)
 
-        mock_final_response = Mock()
-        mock_final_response.content = [Mock(text="Final response")]
+        assert [r["tool_use_id"] for r in results] == ["tool_1", "tool_2"]
+        assert results[0]["content"] == "Error executing tool: boom"
+        assert results[1]["content"] == "works result"
+        # Plain execute_tool managers report no per-call sources
+        assert sources == []
 
+    def test_generate_response_merges_parallel_sources_in_block_order(
+        self, mock_client, generator
+    ):
+        """Test a multi-search round reports sources in block order, not finish order"""
+        blocks = [
+            ToolBlock("tool_use", "search_course_content", {"query": q}, f"tool_{q}")
+            for q in ("slow", "fast")
+        ]
         mock_client.messages.create.side_effect = [
-            mock_initial_response,
-            mock_final_response,
+            resp(blocks=blocks, stop="tool_use"),
+            resp("Answer"),
         ]
 
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.return_value = "Tool result"
+        def execute_tool_with_sources(name, query):
+            if query == "slow":
+                # Finish after the second call so completion order differs
+                time.sleep(0.02)
+            return f"{query} result", [{"display": query}]
 
-        generator = AIGenerator("test-api-key", "claude-sonnet-4-20250514")
+        tool_manager = Mock(spec=["execute_tool_with_sources"])
+        tool_manager.execute_tool_with_sources.side_effect = execute_tool_with_sources
+
+        sources = []
         result = generator.generate_response(
-            "Initial query", tools=[], tool_manager=mock_tool_manager
+            "Query", tools=[], tool_manager=tool_manager, sources=sources
+        )
+
+        assert result == "Answer"
+        assert sources == [{"display": "slow"}, {"display": "fast"}]
+
+    def test_handle_tool_execution_message_flow(
+        self, mock_client, generator, tool_manager
+    ):
+        """Test proper message flow during tool execution"""
+        # Setup tool use scenario
+        mock_initial_response = tool_use("test_tool", {"param": "value"}, "tool_123")
+
+        mock_final_response = resp("Final response")
+
+        # Record request kwargs in a plain list rather than via call_args_list
+        calls = []
+        responses = iter([mock_initial_response, mock_final_response])
+
+        def record(**kwargs):
+            calls.append(kwargs)
+            return next(responses)
+
+        mock_client.messages.create.side_effect = record
+
+        tool_manager.execute_tool.return_value = "Tool result"
+
+        result = generator.generate_response(
+            "Initial query", tools=[], tool_manager=tool_manager
         )
 
         # Verify final API call structure
-        final_call_args = mock_client.messages.create.call_args_list[1][1]
-        messages = final_call_args["messages"]
+        assert len(calls) == 2
+        messages = calls[1]["messages"]
 
         # Should have: initial user message, assistant tool use, tool results
         assert len(messages) == 3
@@ -247,17 +580,11 @@ class TestAIGenerator:
         assert messages[2]["content"][0]["tool_use_id"] == "tool_123"
         assert messages[2]["content"][0]["content"] == "Tool result"
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_api_error_handling(self, mock_anthropic_class):
+    def test_api_error_handling(self, mock_client, generator):
         """Test handling of API errors"""
-        mock_client = Mock()
-        mock_anthropic_class.return_value = mock_client
-
         # Simulate API error
         mock_client.messages.create.side_effect = Exception("API Error")
 
-        generator = AIGenerator("test-api-key", "claude-sonnet-4-20250514")
-
         # Our new implementation catches exceptions and returns error messages
         result = generator.generate_response("Test query")
         assert "encountered an error while processing your request" in result
@@ -265,242 +592,371 @@ class TestAIGenerator:
 
     def test_system_prompt_content(self):
         """Test that system prompt contains expected guidance"""
-        prompt = AIGenerator.SYSTEM_PROMPT
-
-        # Check for key components
-        assert "course materials" in prompt.lower()
-        assert "search_course_content" in prompt
-        assert "get_course_outline" in prompt
-        assert "tool" in prompt.lower()
-        assert "brief" in prompt.lower() or "concise" in prompt.lower()
-
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_tool_execution_without_manager(self, mock_anthropic_class):
+        # One regex pass collects every key component; tool names must match case
+        matches = set(_NEEDLE_RE.findall(_PROMPT))
+        found = {match.lower() for match in matches}
+        assert {"search_course_content", "get_course_outline"} <= matches
+        assert {"course materials", "tool"} <= found
+        assert "brief" in found or "concise" in found
+
+    def test_tool_execution_without_manager(self, mock_client, generator):
         """Test tool use response when no tool manager provided"""
-        mock_client = Mock()
-        mock_anthropic_class.return_value = mock_client
-
-        mock_tool_block = Mock()
-        mock_tool_block.type = "tool_use"
-        mock_tool_block.name = "test_tool"
-
-        mock_response = Mock()
-        mock_response.content = [mock_tool_block]
-        mock_response.stop_reason = "tool_use"
+        mock_response = tool_use("test_tool", {}, "tool_123")
         mock_client.messages.create.return_value = mock_response
 
-        generator = AIGenerator("test-api-key", "claude-sonnet-4-20250514")
-
         # Without tool_manager, it should go through loop and hit fallback
         result = generator.generate_response("Test", tools=[], tool_manager=None)
         assert "unable to complete the request" in result
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_sequential_tool_calling_two_rounds(self, mock_anthropic_class):
-        """Test successful two-round sequential tool calling"""
-        mock_client = Mock()
-        mock_anthropic_class.return_value = mock_client
-
-        # Round 1: Tool use
-        mock_tool_block1 = Mock()
-        mock_tool_block1.type = "tool_use"
-        mock_tool_block1.name = "get_course_outline"
-        mock_tool_block1.input = {"course_name": "MCP"}
-        mock_tool_block1.id = "tool_123"
-
-        mock_response1 = Mock()
-        mock_response1.content = [mock_tool_block1]
-        mock_response1.stop_reason = "tool_use"
-
-        # Round 1 follow-up: Requests more tools
-        mock_tool_block2 = Mock()
-        mock_tool_block2.type = "tool_use"
-        mock_tool_block2.name = "search_course_content"
-        mock_tool_block2.input = {"query": "lesson 4", "course_name": "MCP"}
-        mock_tool_block2.id = "tool_456"
-
-        mock_response2 = Mock()
-        mock_response2.content = [mock_tool_block2]
-        mock_response2.stop_reason = "tool_use"
-
-        # Round 2 follow-up: Final response
-        mock_response3 = Mock()
-        mock_response3.content = [Mock(text="Final response with comprehensive info")]
-        mock_response3.stop_reason = "end_turn"
-
-        # Configure mock to return responses in sequence
-        mock_client.messages.create.side_effect = [
-            mock_response1,  # Initial tool use
-            mock_response2,  # Round 1 follow-up requesting more tools
-            mock_response3,  # Round 2 follow-up final response
-        ]
+    def test_text_with_empty_tool_call_returns_text(
+        self, mock_client, generator, tool_manager
+    ):
+        """Test text sent alongside an empty tool call is returned directly"""
+        mock_text_block = SimpleNamespace(type="text", text="The answer is 42.")
 
-        # Setup tool manager
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.side_effect = [
-            "Course outline result",
-            "Search content result",
-        ]
+        mock_tool_block = ToolBlock("tool_use", "search_course_content", {}, "tool_123")
+
+        mock_response = resp(blocks=[mock_text_block, mock_tool_block], stop="tool_use")
+        mock_client.messages.create.return_value = mock_response
 
-        generator = AIGenerator("test-api-key", "claude-sonnet-4-20250514")
         result = generator.generate_response(
-            "Tell me about lesson 4 of MCP course",
-            tools=[{"name": "get_course_outline"}, {"name": "search_course_content"}],
-            tool_manager=mock_tool_manager,
+            "Question", tools=[], tool_manager=tool_manager
         )
 
-        assert result == "Final response with comprehensive info"
+        assert result == "The answer is 42."
+        mock_client.messages.create.assert_called_once()
+        tool_manager.execute_tool.assert_not_called()
+
+    @pytest.mark.parametrize(
+        "responses,tool_results,expected_text,expected_tool_calls,final_tool_choice",
+        [case[1:] for case in SEQ_CASES],
+        ids=[case[0] for case in SEQ_CASES],
+    )
+    def test_sequential_tool_calling(
+        self,
+        mock_client,
+        generator,
+        tool_manager,
+        responses,
+        tool_results,
+        expected_text,
+        expected_tool_calls,
+        final_tool_choice,
+    ):
+        """Test sequential tool rounds end with the right answer and API calls"""
+        mock_client.messages.create.side_effect = responses
+
+        tool_manager.execute_tool.side_effect = tool_results
 
-        # Verify both tools were executed
-        assert mock_tool_manager.execute_tool.call_count == 2
-        mock_tool_manager.execute_tool.assert_any_call(
-            "get_course_outline", course_name="MCP"
-        )
-        mock_tool_manager.execute_tool.assert_any_call(
-            "search_course_content", query="lesson 4", course_name="MCP"
+        result = generator.generate_response(
+            "Tell me about lesson 4 of MCP course",
+            tools=[{"name": "get_course_outline"}, {"name": "search_course_content"}],
+            tool_manager=tool_manager,
         )
 
-        # Verify 3 API calls were made (round 1 initial + follow-up, round 2 follow-up)
-        assert mock_client.messages.create.call_count == 3
+        assert result == expected_text
+        assert tool_manager.execute_tool.call_args_list == expected_tool_calls
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_sequential_tool_calling_early_termination(self, mock_anthropic_class):
-        """Test early termination when Claude is satisfied after first round"""
-        mock_client = Mock()
-        mock_anthropic_class.return_value = mock_client
+        # One API call per response: no extra rounds past the final answer
+        calls = mock_client.messages.create.call_args_list
+        assert len(calls) == len(responses)
 
-        # Round 1: Tool use
-        mock_tool_block = Mock()
-        mock_tool_block.type = "tool_use"
-        mock_tool_block.name = "get_course_outline"
-        mock_tool_block.input = {"course_name": "MCP"}
-        mock_tool_block.id = "tool_123"
+        # System prompt stays identical across rounds so the cached prefix is reused
+        systems = [c.kwargs["system"] for c in calls]
+        assert all(system == systems[0] for system in systems)
+        round_marker = calls[1].kwargs["messages"][2]
+        assert round_marker["content"][-1] == {"type": "text", "text": "[Round 2 of 2]"}
 
-        mock_response1 = Mock()
-        mock_response1.content = [mock_tool_block]
-        mock_response1.stop_reason = "tool_use"
+        # Closing call keeps the cached tool schemas; only a forced close disables them
+        assert calls[-1].kwargs["tools"][0]["name"] == "get_course_outline"
+        assert calls[-1].kwargs["tool_choice"] == final_tool_choice
 
-        # Round 1 follow-up: Final response (no more tools)
-        mock_response2 = Mock()
-        mock_response2.content = [Mock(text="Complete response after first tool")]
-        mock_response2.stop_reason = "end_turn"
+    def test_sequential_tool_calling_error_in_round_two(
+        self, mock_client, generator, tool_manager
+    ):
+        """Test error handling when second round fails"""
+        # Round 1 successful
+        mock_response1 = tool_use(
+            "get_course_outline", {"course_name": "MCP"}, "tool_123"
+        )
+
+        # Round 1 follow-up requesting more tools
+        mock_response2 = mock_response1  # Reuse for simplicity
 
-        mock_client.messages.create.side_effect = [mock_response1, mock_response2]
+        # Round 2 fails
+        mock_client.messages.create.side_effect = [
+            mock_response1,
+            mock_response2,
+            Exception("API Error in round 2"),
+        ]
 
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.return_value = "Course outline result"
+        tool_manager.execute_tool.return_value = "Tool result"
 
-        generator = AIGenerator("test-api-key", "claude-sonnet-4-20250514")
         result = generator.generate_response(
-            "What is the MCP course about?",
+            "Complex query",
             tools=[{"name": "get_course_outline"}],
-            tool_manager=mock_tool_manager,
+            tool_manager=tool_manager,
         )
 
-        assert result == "Complete response after first tool"
+        # Should return graceful error message for later round failure
+        assert "gathered some information but encountered an error" in result
+
+    def test_generate_response_async_simple(self, mock_async_client, generator):
+        """Test async response generation without tools"""
+        mock_async_client.messages.create = AsyncMock()
+
+        mock_response = resp("Async response")
+        mock_async_client.messages.create.return_value = mock_response
+
+        result = asyncio.run(generator.generate_response_async("What is AI?"))
+
+        assert result == "Async response"
+        _, messages, system = _GET(mock_async_client.messages.create.call_args.kwargs)
+        assert messages[0]["content"] == "What is AI?"
+        assert system[0]["text"] == AIGenerator.SYSTEM_PROMPT
+
+    def test_generate_response_async_multiple_tools(
+        self, mock_async_client, generator, tool_manager
+    ):
+        """Test async path runs every tool call and keeps result order"""
+        mock_async_client.messages.create = AsyncMock()
 
-        # Verify only one tool execution
-        mock_tool_manager.execute_tool.assert_called_once_with(
-            "get_course_outline", course_name="MCP"
+        mock_tool_block1 = ToolBlock(
+            "tool_use", "search_course_content", {"query": "test query 1"}, "tool_123"
         )
 
-        # Verify only 2 API calls (round 1 initial + follow-up, no round 2)
-        assert mock_client.messages.create.call_count == 2
+        mock_tool_block2 = ToolBlock(
+            "tool_use", "get_course_outline", {"course_name": "Test Course"}, "tool_456"
+        )
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_sequential_tool_calling_max_rounds_reached(self, mock_anthropic_class):
-        """Test termination when max rounds (2) is reached"""
-        mock_client = Mock()
-        mock_anthropic_class.return_value = mock_client
+        mock_initial_response = resp(
+            blocks=[mock_tool_block1, mock_tool_block2], stop="tool_use"
+        )
+
+        mock_final_response = resp("Combined async results")
 
-        # Create mock responses that always want more tools for round 1 & 2
-        mock_tool_block = Mock()
-        mock_tool_block.type = "tool_use"
-        mock_tool_block.name = "search_course_content"
-        mock_tool_block.input = {"query": "test"}
-        mock_tool_block.id = "tool_123"
+        mock_async_client.messages.create.side_effect = [
+            mock_initial_response,
+            mock_final_response,
+        ]
 
-        mock_tool_response = Mock()
-        mock_tool_response.content = [mock_tool_block]
-        mock_tool_response.stop_reason = "tool_use"
+        tool_manager.execute_tool.side_effect = lambda name, **kwargs: name
 
-        # Final response for round 2 after tools
-        mock_final_response = Mock()
-        mock_final_response.content = [Mock(text="Final response after max rounds")]
-        mock_final_response.stop_reason = "end_turn"
+        result = asyncio.run(
+            generator.generate_response_async(
+                "Complex query", tools=[], tool_manager=tool_manager
+            )
+        )
 
-        # Mock API calls: round1 tool -> round2 tool -> final response
-        mock_client.messages.create.side_effect = [
-            mock_tool_response,  # Round 1
-            mock_tool_response,  # Round 2
-            mock_final_response,  # Final response after max rounds
+        assert result == "Combined async results"
+        assert tool_manager.execute_tool.call_count == 2
+
+        tool_turn = mock_async_client.messages.create.call_args_list[1].kwargs[
+            "messages"
+        ][-1]
+        assert [block.get("tool_use_id") for block in tool_turn["content"][:2]] == [
+            "tool_123",
+            "tool_456",
         ]
+        assert tool_turn["content"][0]["content"] == "search_course_content"
+
+    def test_generate_response_async_collects_sources_per_call(
+        self, mock_async_client, generator
+    ):
+        """Test async tool sources come back with the calls, in block order"""
+        blocks = [
+            ToolBlock("tool_use", "search_course_content", {"query": q}, f"tool_{q}")
+            for q in ("slow", "fast")
+        ]
+        mock_async_client.messages.create = AsyncMock(
+            side_effect=[resp(blocks=blocks, stop="tool_use"), resp("Answer")]
+        )
 
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.return_value = "Tool result"
+        def execute_tool_with_sources(name, query):
+            if query == "slow":
+                # Finish after the second call so completion order differs
+                time.sleep(0.02)
+            return f"{query} result", [{"display": query}]
 
-        generator = AIGenerator("test-api-key", "claude-sonnet-4-20250514")
-        result = generator.generate_response(
-            "Complex query requiring many tools",
-            tools=[{"name": "search_course_content"}],
-            tool_manager=mock_tool_manager,
+        tool_manager = Mock(spec=["execute_tool_with_sources"])
+        tool_manager.execute_tool_with_sources.side_effect = execute_tool_with_sources
+
+        sources = []
+        result = asyncio.run(
+            generator.generate_response_async(
+                "Query", tools=[], tool_manager=tool_manager, sources=sources
+            )
         )
 
-        # Should terminate after max rounds and return final response
-        assert result == "Final response after max rounds"
+        assert result == "Answer"
+        assert sources == [{"display": "slow"}, {"display": "fast"}]
 
-        # Should have executed tools for both rounds
-        assert mock_tool_manager.execute_tool.call_count == 2
+    def test_generate_response_stream_simple(self, mock_async_client, generator):
+        """Test streamed responses forward text deltas as they arrive"""
+        final_message = SimpleNamespace(stop_reason="end_turn")
+        mock_async_client.messages.stream.return_value = FakeMessageStream(
+            ["Hello", " world"], final_message
+        )
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_sequential_tool_calling_error_in_round_two(self, mock_anthropic_class):
-        """Test error handling when second round fails"""
-        mock_client = Mock()
-        mock_anthropic_class.return_value = mock_client
+        chunks = asyncio.run(
+            collect_stream(generator.generate_response_stream("What is AI?"))
+        )
 
-        # Round 1 successful
-        mock_tool_block = Mock()
-        mock_tool_block.type = "tool_use"
-        mock_tool_block.name = "get_course_outline"
-        mock_tool_block.input = {"course_name": "MCP"}
-        mock_tool_block.id = "tool_123"
+        assert chunks == ["Hello", " world"]
+        mock_async_client.messages.stream.assert_called_once()
 
-        mock_response1 = Mock()
-        mock_response1.content = [mock_tool_block]
-        mock_response1.stop_reason = "tool_use"
+    def test_generate_response_stream_after_tool_rounds(
+        self,
+        mock_async_client,
+        generator,
+        tool_manager,
+    ):
+        """Test streaming runs tool rounds and streams the final answer"""
+        tool_message = tool_use("search_course_content", {"query": "test"}, "tool_123")
 
-        # Round 1 follow-up requesting more tools
-        mock_response2 = Mock()
-        mock_response2.content = [mock_tool_block]  # Reuse for simplicity
-        mock_response2.stop_reason = "tool_use"
+        final_message = SimpleNamespace(stop_reason="end_turn")
 
-        # Round 2 fails
-        mock_client.messages.create.side_effect = [
-            mock_response1,
-            mock_response2,
-            Exception("API Error in round 2"),
+        mock_async_client.messages.stream.side_effect = [
+            FakeMessageStream([], tool_message),
+            FakeMessageStream([], tool_message),
+            FakeMessageStream(["Final", " answer"], final_message),
         ]
 
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.return_value = "Tool result"
+        tool_manager.execute_tool.return_value = "Tool result"
 
-        generator = AIGenerator("test-api-key", "claude-sonnet-4-20250514")
-        result = generator.generate_response(
-            "Complex query",
-            tools=[{"name": "get_course_outline"}],
-            tool_manager=mock_tool_manager,
+        chunks = asyncio.run(
+            collect_stream(
+                generator.generate_response_stream(
+                    "Search query",
+                    tools=[{"name": "search_course_content"}],
+                    tool_manager=tool_manager,
+                )
+            )
         )
 
-        # Should return graceful error message for later round failure
-        assert "gathered some information but encountered an error" in result
+        assert chunks == ["Final", " answer"]
+        assert tool_manager.execute_tool.call_count == 2
+        final_call = mock_async_client.messages.stream.call_args_list[2].kwargs
+        assert final_call["tool_choice"] == {"type": "none"}
+
+    def test_generate_response_stream_drops_tool_round_preamble(
+        self, mock_async_client, generator, tool_manager
+    ):
+        """Test text sent before a tool call streams live and is then retracted"""
+        from anthropic.types import TextBlock
+
+        preamble = "Let me search the course materials."
+        tool_message = resp(
+            blocks=[
+                TextBlock(type="text", text=preamble),
+                ToolBlock("tool_use", "search_course_content", {"query": "MCP"}, "t1"),
+            ],
+            stop="tool_use",
+        )
+        final_message = SimpleNamespace(stop_reason="end_turn")
+
+        mock_async_client.messages.stream.side_effect = [
+            FakeMessageStream([preamble], tool_message),
+            FakeMessageStream(["MCP is", " a protocol."], final_message),
+        ]
+        tool_manager.execute_tool.return_value = "Tool result"
+
+        chunks = asyncio.run(
+            collect_stream(
+                generator.generate_response_stream(
+                    "What is MCP?",
+                    tools=[{"name": "search_course_content"}],
+                    tool_manager=tool_manager,
+                )
+            )
+        )
+
+        # The preamble is not held back, but it is retracted before the answer
+        assert chunks == [preamble, STREAM_RESET, "MCP is", " a protocol."]
+        tool_manager.execute_tool.assert_called_once_with(
+            "search_course_content", query="MCP"
+        )
+
+    def test_generate_response_stream_routes_and_caches(
+        self, mock_async_client, tool_manager
+    ):
+        """Test streaming routes through the fast model and caches the answer"""
+        mock_async_client.messages.create = AsyncMock(return_value=resp("N"))
+        mock_async_client.messages.stream.return_value = FakeMessageStream(
+            ["Par", "is"], SimpleNamespace(stop_reason="end_turn")
+        )
+        generator = AIGenerator(
+            "test-api-key", "claude-sonnet-4-20250514", "claude-haiku-4-5-20251001"
+        )
+
+        def ask():
+            return asyncio.run(
+                collect_stream(
+                    generator.generate_response_stream(
+                        "Answer this: Capital of France?",
+                        tools=[{"name": "search_course_content"}],
+                        tool_manager=tool_manager,
+                        route_query="Capital of France?",
+                    )
+                )
+            )
+
+        assert ask() == ["Par", "is"]
+        router_args = mock_async_client.messages.create.call_args.kwargs
+        assert router_args["messages"][0]["content"] == "Capital of France?"
+        stream_args = mock_async_client.messages.stream.call_args.kwargs
+        assert stream_args["model"] == "claude-haiku-4-5-20251001"
+        assert "tools" not in stream_args
+
+        # The repeat is served whole from the cache, with no further API calls
+        assert ask() == ["Paris"]
+        mock_async_client.messages.create.assert_awaited_once()
+        mock_async_client.messages.stream.assert_called_once()
+
+    def test_batch_generate_orders_results_by_custom_id(self):
+        """Test batch results are polled to completion and returned in order"""
+        mock_client = Mock()
+        mock_client.messages.batches.create.return_value = SimpleNamespace(
+            id="batch_1", processing_status="in_progress"
+        )
+        mock_client.messages.batches.retrieve.return_value = SimpleNamespace(
+            id="batch_1", processing_status="ended"
+        )
+
+        def batch_entry(custom_id, result_type, text=None):
+            message = SimpleNamespace(content=[SimpleNamespace(text=text)])
+            return SimpleNamespace(
+                custom_id=custom_id,
+                result=SimpleNamespace(type=result_type, message=message),
+            )
+
+        mock_client.messages.batches.results.return_value = [
+            batch_entry("q-1", "succeeded", "Second answer"),
+            batch_entry("q-0", "succeeded", "First answer"),
+            batch_entry("q-2", "errored"),
+        ]
+
+        results = AIGenerator.batch_generate(
+            mock_client,
+            "claude-sonnet-4-20250514",
+            ["First?", "Second?", "Third?"],
+            poll_interval=0,
+        )
+
+        assert results[:2] == ["First answer", "Second answer"]
+        assert "errored" in results[2]
+        mock_client.messages.batches.retrieve.assert_called_once_with("batch_1")
+
+        requests = mock_client.messages.batches.create.call_args.kwargs["requests"]
+        assert [r["custom_id"] for r in requests] == ["q-0", "q-1", "q-2"]
+        assert requests[0]["params"]["messages"][0]["content"] == "First?"
+        assert requests[0]["params"]["system"][0]["text"] == AIGenerator.SYSTEM_PROMPT
 
     def test_system_prompt_sequential_guidance(self):
         """Test that system prompt includes sequential tool calling guidance"""
-        prompt = AIGenerator.SYSTEM_PROMPT
-
         # Check for sequential tool calling guidance
-        assert "Sequential tool usage" in prompt
-        assert "2 rounds" in prompt
-        assert "Strategic tool combinations" in prompt
+        assert "Sequential tool usage" in _PROMPT
+        assert "2 rounds" in _PROMPT
+        assert "Strategic tool combinations" in _PROMPT
         # Should no longer have the old restriction
-        assert "One tool call per query maximum" not in prompt
+        assert "One tool call per query maximum" not in _PROMPT
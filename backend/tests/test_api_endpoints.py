@@ -1,45 +1,60 @@
-import sys
-from pathlib import Path
+import json
+from operator import attrgetter
 from unittest.mock import Mock, patch
 
 import pytest
-
-# Add parent directory to Python path for imports
-backend_path = Path(__file__).parent.parent
-sys.path.insert(0, str(backend_path))
+from models import (
+    ClearSessionRequest,
+    ClearSessionResponse,
+    CourseStats,
+    QueryRequest,
+    QueryResponse,
+)
+from pydantic import ValidationError
+
+# Full response bodies the canned RAG answers should produce; the response
+# models check their shape first
+_EXPECTED_QUERY = {
+    "answer": "This is a test response about the course material.",
+    "sources": ["Source 1: Test Course - Lesson 1", "Source 2: Test Course - Lesson 2"],
+    "session_id": "test-session-123",
+}
+_EXPECTED_COURSES = {
+    "total_courses": 3,
+    "course_titles": ["Course 1", "Course 2", "Course 3"],
+}
+_EXPECTED_CLEAR_SESSION = {
+    "success": True,
+    "message": "Session test-session-123 cleared successfully",
+}
 
 
 @pytest.mark.api
 class TestAPIEndpoints:
     """Test FastAPI endpoints for proper request/response handling"""
 
-    def test_root_endpoint(self, test_client):
+    def test_root_endpoint(self, test_client, stub_rag_system):
         """Test the root endpoint returns correct response"""
         response = test_client.get("/")
 
         assert response.status_code == 200
         assert response.json() == {"message": "Course Materials RAG System API"}
 
-    def test_query_endpoint_with_session(self, test_client, sample_query_request):
+    def test_query_endpoint_with_session(
+        self, test_client, stub_rag_system, sample_query_request
+    ):
         """Test /api/query endpoint with existing session ID"""
         response = test_client.post("/api/query", json=sample_query_request)
 
         assert response.status_code == 200
         data = response.json()
 
-        # Verify response structure
-        assert "answer" in data
-        assert "sources" in data
-        assert "session_id" in data
-
-        # Verify response content
-        assert data["answer"] == "This is a test response about the course material."
-        assert data["session_id"] == "test-session-123"
-        assert isinstance(data["sources"], list)
-        assert len(data["sources"]) == 2
+        # Verify response structure, then content
+        QueryResponse.model_validate(data, strict=True)
+        assert data == _EXPECTED_QUERY
 
     def test_query_endpoint_without_session(
-        self, test_client, sample_query_request_no_session
+        self, test_client, stub_rag_system, sample_query_request_no_session
     ):
         """Test /api/query endpoint creates new session when none provided"""
         response = test_client.post("/api/query", json=sample_query_request_no_session)
@@ -51,37 +66,50 @@ class TestAPIEndpoints:
         assert data["session_id"] == "test-session-123"  # From mock
         assert data["answer"] == "This is a test response about the course material."
 
-    def test_query_endpoint_invalid_request(self, test_client):
-        """Test /api/query endpoint with invalid request data"""
-        # Missing required 'query' field
-        invalid_request = {"session_id": "test-session"}
+    def test_query_request_requires_query(self):
+        """Test QueryRequest rejects a body without the required 'query' field"""
+        with pytest.raises(ValidationError):
+            QueryRequest.model_validate({"session_id": "test-session"})
+
+    def test_query_request_accepts_empty_query(self):
+        """Test QueryRequest accepts an empty query string"""
+        request = QueryRequest(query="")
 
-        response = test_client.post("/api/query", json=invalid_request)
-        assert response.status_code == 422  # Validation error
+        assert request.query == ""
+        assert request.session_id is None
 
-    def test_query_endpoint_empty_query(self, test_client):
-        """Test /api/query endpoint with empty query"""
-        empty_query = {"query": ""}
+    def test_query_stream_endpoint(self, test_client, sample_query_request):
+        """Test /api/query/stream emits SSE deltas and a final done event"""
+        response = test_client.post("/api/query/stream", json=sample_query_request)
 
-        response = test_client.post("/api/query", json=empty_query)
-        assert response.status_code == 200  # Should still process empty query
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+
+        events = [
+            json.loads(line.removeprefix("data: "))
+            for line in response.text.splitlines()
+            if line.startswith("data: ")
+        ]
+        answer = "".join(e["text"] for e in events if e["type"] == "delta")
+        assert answer == "This is a streamed response."
+        assert events[-1]["type"] == "done"
+        assert events[-1]["session_id"] == "test-session-123"
+        assert events[-1]["sources"] == ["Source 1: Test Course - Lesson 1"]
 
-    def test_courses_endpoint(self, test_client):
+    def test_courses_endpoint(self, test_client, stub_rag_system):
         """Test /api/courses endpoint returns course statistics"""
         response = test_client.get("/api/courses")
 
         assert response.status_code == 200
         data = response.json()
 
-        # Verify response structure
-        assert "total_courses" in data
-        assert "course_titles" in data
+        # Verify response structure, then content from mock
+        CourseStats.model_validate(data, strict=True)
+        assert data == _EXPECTED_COURSES
 
-        # Verify response content from mock
-        assert data["total_courses"] == 3
-        assert data["course_titles"] == ["Course 1", "Course 2", "Course 3"]
-
-    def test_clear_session_endpoint(self, test_client, sample_clear_session_request):
+    def test_clear_session_endpoint(
+        self, test_client, stub_rag_system, sample_clear_session_request
+    ):
         """Test /api/session/clear endpoint"""
         response = test_client.post(
             "/api/session/clear", json=sample_clear_session_request
@@ -90,59 +118,60 @@ class TestAPIEndpoints:
         assert response.status_code == 200
         data = response.json()
 
-        # Verify response structure
-        assert "success" in data
-        assert "message" in data
-
-        # Verify response content
-        assert data["success"] is True
-        assert "test-session-123" in data["message"]
-
-    def test_clear_session_endpoint_invalid_request(self, test_client):
-        """Test /api/session/clear endpoint with invalid request"""
-        # Missing required 'session_id' field
-        invalid_request = {}
-
-        response = test_client.post("/api/session/clear", json=invalid_request)
-        assert response.status_code == 422  # Validation error
-
-    def test_query_endpoint_rag_system_error(self, test_client, mock_rag_system):
-        """Test /api/query endpoint handles RAG system errors gracefully"""
-        # Configure mock to raise exception
-        mock_rag_system.query.side_effect = Exception("Database connection failed")
-
-        query_request = {"query": "test query"}
-        response = test_client.post("/api/query", json=query_request)
-
-        assert response.status_code == 500
-        assert "Database connection failed" in response.json()["detail"]
-
-    def test_courses_endpoint_rag_system_error(self, test_client, mock_rag_system):
-        """Test /api/courses endpoint handles RAG system errors gracefully"""
-        # Configure mock to raise exception
-        mock_rag_system.get_course_analytics.side_effect = Exception(
-            "Analytics service unavailable"
-        )
-
-        response = test_client.get("/api/courses")
-
-        assert response.status_code == 500
-        assert "Analytics service unavailable" in response.json()["detail"]
-
-    def test_clear_session_endpoint_rag_system_error(
-        self, test_client, mock_rag_system
+        # Verify response structure, then content
+        ClearSessionResponse.model_validate(data, strict=True)
+        assert data == _EXPECTED_CLEAR_SESSION
+
+    def test_clear_session_request_requires_session_id(self):
+        """Test ClearSessionRequest rejects a body without 'session_id'"""
+        with pytest.raises(ValidationError):
+            ClearSessionRequest.model_validate({})
+
+    @pytest.mark.parametrize(
+        "attr_path, side_effect_msg, method, url, payload",
+        [
+            (
+                "query_async",
+                "Database connection failed",
+                "POST",
+                "/api/query",
+                {"query": "test query"},
+            ),
+            (
+                "get_course_analytics",
+                "Analytics service unavailable",
+                "GET",
+                "/api/courses",
+                None,
+            ),
+            (
+                "session_manager.clear_session",
+                "Session service error",
+                "POST",
+                "/api/session/clear",
+                {"session_id": "test-session"},
+            ),
+        ],
+        ids=["query", "courses", "clear_session"],
+    )
+    def test_endpoint_rag_system_error(
+        self,
+        test_client,
+        mock_rag_system,
+        attr_path,
+        side_effect_msg,
+        method,
+        url,
+        payload,
     ):
-        """Test /api/session/clear endpoint handles RAG system errors gracefully"""
-        # Configure mock to raise exception
-        mock_rag_system.session_manager.clear_session.side_effect = Exception(
-            "Session service error"
-        )
+        """Test endpoints handle RAG system errors gracefully"""
+        # Configure the backing mock method to raise exception
+        attrgetter(attr_path)(mock_rag_system).side_effect = Exception(side_effect_msg)
 
-        clear_request = {"session_id": "test-session"}
-        response = test_client.post("/api/session/clear", json=clear_request)
+        response = test_client.request(method, url, json=payload)
 
         assert response.status_code == 500
-        assert "Session service error" in response.json()["detail"]
+        assert side_effect_msg in response.json()["detail"]
 
     def test_query_endpoint_content_type_validation(self, test_client):
         """Test /api/query endpoint requires JSON content type"""
@@ -152,7 +181,7 @@ class TestAPIEndpoints:
         # Should return 422 due to content type mismatch
         assert response.status_code == 422
 
-    def test_cors_middleware_configured(self, test_client):
+    def test_cors_middleware_configured(self, test_client, stub_rag_system):
         """Test that CORS middleware is configured properly"""
         # Test OPTIONS request which should trigger CORS behavior
         response = test_client.options("/api/courses")
@@ -167,22 +196,17 @@ class TestAPIEndpoints:
         response = test_client.get("/api/courses")
         assert response.status_code == 200
 
-    def test_api_response_models_validation(self, test_client, mock_rag_system):
-        """Test API response models handle different data types correctly"""
+    def test_api_response_models_validation(self):
+        """Test QueryResponse accepts both string and dict sources"""
         # Test with mixed source types (string and dict)
-        mock_rag_system.query.return_value = (
-            "Test response",
-            ["String source", {"title": "Dict source", "lesson": 1}],
+        response = QueryResponse(
+            answer="Test response",
+            sources=["String source", {"title": "Dict source", "lesson": 1}],
+            session_id="test-session",
         )
 
-        query_request = {"query": "test query"}
-        response = test_client.post("/api/query", json=query_request)
-
-        assert response.status_code == 200
-        data = response.json()
-
         # Verify mixed source types are handled correctly
-        sources = data["sources"]
+        sources = response.model_dump()["sources"]
         assert len(sources) == 2
         assert sources[0] == "String source"
         assert isinstance(sources[1], dict)
@@ -217,30 +241,25 @@ class TestAPIEndpoints:
         assert response.status_code == 200
 
         # Verify RAG system was called with correct parameters
-        mock_rag_system.query.assert_called_once_with(
+        mock_rag_system.query_async.assert_awaited_once_with(
             "What is artificial intelligence?", "custom-session-789"
         )
 
-    def test_api_endpoint_routing(self, test_client):
-        """Test that all API endpoints are properly routed"""
-        # Test valid endpoints
-        endpoints_to_test = [
+    @pytest.mark.parametrize(
+        "endpoint, method, expected_status",
+        [
             ("/", "get", 200),
             ("/api/courses", "get", 200),
-        ]
-
-        for endpoint, method, expected_status in endpoints_to_test:
-            if method == "get":
-                response = test_client.get(endpoint)
-            else:
-                response = test_client.post(endpoint)
-
-            assert response.status_code == expected_status
+            ("/api/nonexistent", "get", 404),
+        ],
+    )
+    def test_api_endpoint_routing(
+        self, test_client, stub_rag_system, endpoint, method, expected_status
+    ):
+        """Test that API endpoints are routed and unknown ones return 404"""
+        response = getattr(test_client, method)(endpoint)
 
-    def test_nonexistent_endpoint(self, test_client):
-        """Test that nonexistent endpoints return 404"""
-        response = test_client.get("/api/nonexistent")
-        assert response.status_code == 404
+        assert response.status_code == expected_status
 
     def test_unsupported_method(self, test_client):
         """Test that unsupported HTTP methods return 405"""
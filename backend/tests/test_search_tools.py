@@ -1,24 +1,68 @@
-import sys
-from pathlib import Path
-from unittest.mock import Mock, patch
-
 import pytest
-
-# Add parent directory to path
-backend_path = Path(__file__).parent.parent
-sys.path.insert(0, str(backend_path))
-
 from search_tools import CourseOutlineTool, CourseSearchTool, ToolManager
 from vector_store import SearchResults
 
+# What CourseSearchTool formats the default two-result search into
+_EXPECTED_SEARCH_OUTPUT = (
+    "[Test Course - Lesson 1]\nTest content from course 1\n\n"
+    "[Test Course - Lesson 2]\nMore content from course 1"
+)
+
+# Catalog answers for the outline failure paths, built once at import
+_META_NO_LESSONS = {
+    "metadatas": [
+        {
+            "title": "Test Course",
+            "course_link": "https://example.com/course",
+            "lessons_json": None,
+        }
+    ]
+}
+_META_NO_METADATA = {"metadatas": []}
+
+
+class _Stub:
+    """Tool stand-in whose definition is missing the required name"""
+
+    get_tool_definition = staticmethod(lambda: {"description": "test"})
+
+
+@pytest.fixture
+def search_results(request):
+    """Session SearchResults fixture named by the parametrized tag"""
+    return request.getfixturevalue(f"{request.param}_search_results")
+
+
+@pytest.fixture
+def search_tool(fake_vector_store):
+    """Search tool over a fresh fake store"""
+    return CourseSearchTool(fake_vector_store)
+
+
+@pytest.fixture
+def mock_search_tool(mock_vector_store):
+    """Search tool over the reset Mock store"""
+    return CourseSearchTool(mock_vector_store)
+
+
+@pytest.fixture
+def outline_tool(fake_vector_store):
+    """Outline tool over a fresh fake store"""
+    return CourseOutlineTool(fake_vector_store)
+
+
+@pytest.fixture
+def mock_outline_tool(mock_vector_store):
+    """Outline tool over the reset Mock store"""
+    return CourseOutlineTool(mock_vector_store)
+
 
 class TestCourseSearchTool:
     """Test CourseSearchTool functionality"""
 
-    def test_get_tool_definition(self, mock_vector_store):
+    def test_get_tool_definition(self, search_tool):
         """Test that tool definition is properly formatted"""
-        tool = CourseSearchTool(mock_vector_store)
-        definition = tool.get_tool_definition()
+        definition = search_tool.get_tool_definition()
 
         assert definition["name"] == "search_course_content"
         assert "description" in definition
@@ -28,88 +72,89 @@ class TestCourseSearchTool:
         assert "course_name" in definition["input_schema"]["properties"]
         assert "lesson_number" in definition["input_schema"]["properties"]
 
-    def test_execute_successful_search(self, mock_vector_store):
-        """Test successful search with results"""
-        tool = CourseSearchTool(mock_vector_store)
+        # Built once; every call returns the same definition
+        assert search_tool.get_tool_definition() is definition
 
-        result = tool.execute("test query")
+    def test_execute_successful_search(
+        self, mock_vector_store, mock_search_tool, default_search_results
+    ):
+        """Test successful search with results"""
+        result = mock_search_tool.execute("test query")
 
         # Verify vector store was called correctly
-        mock_vector_store.search.assert_called_once_with(
-            query="test query", course_name=None, lesson_number=None
-        )
+        assert mock_vector_store.search.call_count == 1
+        assert mock_vector_store.search.call_args.kwargs == {
+            "query": "test query",
+            "course_name": None,
+            "lesson_number": None,
+        }
 
-        # Verify result contains formatted content
-        assert "[Test Course - Lesson 1]" in result
-        assert "[Test Course - Lesson 2]" in result
-        assert "Test content from course 1" in result
-        assert "More content from course 1" in result
+        # Verify result is the formatted content
+        assert result == _EXPECTED_SEARCH_OUTPUT
 
-        # Verify sources were stored
-        assert len(tool.last_sources) == 2
-        assert tool.last_sources[0]["display"] == "Test Course - Lesson 1"
-        assert tool.last_sources[1]["display"] == "Test Course - Lesson 2"
+        # Verify one source was stored per search result, in result order
+        assert [s["display"] for s in mock_search_tool.last_sources] == [
+            f"{meta['course_title']} - Lesson {meta['lesson_number']}"
+            for meta in default_search_results.metadata
+        ]
 
-    def test_execute_with_filters(self, mock_vector_store):
+    def test_execute_with_filters(self, mock_vector_store, mock_search_tool):
         """Test search with course and lesson filters"""
-        tool = CourseSearchTool(mock_vector_store)
-
-        result = tool.execute("test query", course_name="Test Course", lesson_number=1)
-
-        mock_vector_store.search.assert_called_once_with(
-            query="test query", course_name="Test Course", lesson_number=1
+        result = mock_search_tool.execute(
+            "test query", course_name="Test Course", lesson_number=1
         )
 
-    def test_execute_empty_results(self, mock_vector_store, empty_search_results):
-        """Test handling of empty search results"""
-        mock_vector_store.search.return_value = empty_search_results
-        tool = CourseSearchTool(mock_vector_store)
-
-        result = tool.execute("test query")
-
-        assert "No relevant content found" in result
-        assert tool.last_sources == []
+        assert mock_vector_store.search.call_count == 1
+        assert mock_vector_store.search.call_args.kwargs == {
+            "query": "test query",
+            "course_name": "Test Course",
+            "lesson_number": 1,
+        }
 
-    def test_execute_empty_results_with_filters(
-        self, mock_vector_store, empty_search_results
+    @pytest.mark.parametrize(
+        "search_results, kwargs, expected_substring",
+        [
+            ("empty", {}, "No relevant content found"),
+            (
+                "empty",
+                {"course_name": "Test Course", "lesson_number": 1},
+                "No relevant content found in course 'Test Course' in lesson 1",
+            ),
+            ("error", {}, "Database connection failed"),
+        ],
+        ids=["empty", "empty_with_filters", "error"],
+        indirect=["search_results"],
+    )
+    def test_execute_without_results(
+        self, fake_vector_store, search_tool, search_results, kwargs, expected_substring
     ):
-        """Test empty results with filter information"""
-        mock_vector_store.search.return_value = empty_search_results
-        tool = CourseSearchTool(mock_vector_store)
-
-        result = tool.execute("test query", course_name="Test Course", lesson_number=1)
+        """Test empty and failed searches report why and record no sources"""
+        fake_vector_store.search.return_value = search_results
 
-        assert "No relevant content found in course 'Test Course' in lesson 1" in result
+        result = search_tool.execute("test query", **kwargs)
 
-    def test_execute_with_error(self, mock_vector_store, error_search_results):
-        """Test handling of search errors"""
-        mock_vector_store.search.return_value = error_search_results
-        tool = CourseSearchTool(mock_vector_store)
+        assert expected_substring in result
+        assert search_tool.last_sources == []
 
-        result = tool.execute("test query")
-
-        assert "Database connection failed" in result
-
-    def test_format_results_with_links(self, mock_vector_store):
+    def test_format_results_with_links(self, fake_vector_store, search_tool):
         """Test result formatting includes links when available"""
-        # Mock get_lesson_link to return a URL
-        mock_vector_store.get_lesson_link.return_value = "https://example.com/lesson1"
-
-        tool = CourseSearchTool(mock_vector_store)
-        result = tool.execute("test query")
+        result = search_tool.execute("test query")
 
         # Verify sources contain links
-        assert len(tool.last_sources) == 2
-        assert tool.last_sources[0]["link"] is not None
+        assert len(search_tool.last_sources) == 2
+        assert search_tool.last_sources[0]["link"] is not None
+        assert fake_vector_store.get_lesson_link.calls == [
+            (("Test Course", 1), {}),
+            (("Test Course", 2), {}),
+        ]
 
 
 class TestCourseOutlineTool:
     """Test CourseOutlineTool functionality"""
 
-    def test_get_tool_definition(self, mock_vector_store):
+    def test_get_tool_definition(self, outline_tool):
         """Test that tool definition is properly formatted"""
-        tool = CourseOutlineTool(mock_vector_store)
-        definition = tool.get_tool_definition()
+        definition = outline_tool.get_tool_definition()
 
         assert definition["name"] == "get_course_outline"
         assert "description" in definition
@@ -117,19 +162,22 @@ class TestCourseOutlineTool:
         assert definition["input_schema"]["required"] == ["course_name"]
         assert "course_name" in definition["input_schema"]["properties"]
 
-    def test_execute_successful_outline(self, mock_vector_store):
-        """Test successful course outline retrieval"""
-        tool = CourseOutlineTool(mock_vector_store)
+        # Built once; every call returns the same definition
+        assert outline_tool.get_tool_definition() is definition
 
-        result = tool.execute("Test Course")
+    def test_execute_successful_outline(self, mock_vector_store, mock_outline_tool):
+        """Test successful course outline retrieval"""
+        result = mock_outline_tool.execute("Test Course")
 
         # Verify course name was resolved
-        mock_vector_store._resolve_course_name.assert_called_once_with("Test Course")
+        assert mock_vector_store._resolve_course_name.call_count == 1
+        assert mock_vector_store._resolve_course_name.call_args.args == ("Test Course",)
 
         # Verify course catalog was queried
-        mock_vector_store.course_catalog.get.assert_called_once_with(
-            ids=["Test Course"]
-        )
+        assert mock_vector_store.course_catalog.get.call_count == 1
+        assert mock_vector_store.course_catalog.get.call_args.kwargs == {
+            "ids": ["Test Course"]
+        }
 
         # Verify result contains course information
         assert "Course: Test Course" in result
@@ -138,51 +186,39 @@ class TestCourseOutlineTool:
         assert "Lesson 1: Intro" in result
 
         # Verify sources were stored
-        assert len(tool.last_sources) == 1
-        assert tool.last_sources[0]["display"] == "Test Course"
-        assert tool.last_sources[0]["link"] == "https://example.com/course"
+        assert len(mock_outline_tool.last_sources) == 1
+        assert mock_outline_tool.last_sources[0]["display"] == "Test Course"
+        assert mock_outline_tool.last_sources[0]["link"] == "https://example.com/course"
 
-    def test_execute_course_not_found(self, mock_vector_store):
+    def test_execute_course_not_found(self, fake_vector_store, outline_tool):
         """Test handling of course not found"""
-        mock_vector_store._resolve_course_name.return_value = None
-        tool = CourseOutlineTool(mock_vector_store)
+        fake_vector_store._resolve_course_name.return_value = None
 
-        result = tool.execute("Nonexistent Course")
+        result = outline_tool.execute("Nonexistent Course")
 
         assert "No course found matching 'Nonexistent Course'" in result
 
-    def test_execute_no_metadata(self, mock_vector_store):
+    def test_execute_no_metadata(self, fake_vector_store, outline_tool):
         """Test handling of missing course metadata"""
-        mock_vector_store.course_catalog.get.return_value = {"metadatas": []}
-        tool = CourseOutlineTool(mock_vector_store)
+        fake_vector_store.course_catalog.get.return_value = _META_NO_METADATA
 
-        result = tool.execute("Test Course")
+        result = outline_tool.execute("Test Course")
 
         assert "No course metadata found" in result
 
-    def test_execute_no_lessons(self, mock_vector_store):
+    def test_execute_no_lessons(self, fake_vector_store, outline_tool):
         """Test handling of course without lessons"""
-        mock_vector_store.course_catalog.get.return_value = {
-            "metadatas": [
-                {
-                    "title": "Test Course",
-                    "course_link": "https://example.com/course",
-                    "lessons_json": None,
-                }
-            ]
-        }
-        tool = CourseOutlineTool(mock_vector_store)
+        fake_vector_store.course_catalog.get.return_value = _META_NO_LESSONS
 
-        result = tool.execute("Test Course")
+        result = outline_tool.execute("Test Course")
 
         assert "No lesson information available" in result
 
-    def test_execute_with_exception(self, mock_vector_store):
+    def test_execute_with_exception(self, fake_vector_store, outline_tool):
         """Test handling of exceptions during outline retrieval"""
-        mock_vector_store.course_catalog.get.side_effect = Exception("DB Error")
-        tool = CourseOutlineTool(mock_vector_store)
+        fake_vector_store.course_catalog.get.side_effect = Exception("DB Error")
 
-        result = tool.execute("Test Course")
+        result = outline_tool.execute("Test Course")
 
         assert "Error retrieving course outline" in result
         assert "DB Error" in result
@@ -191,85 +227,94 @@ class TestCourseOutlineTool:
 class TestToolManager:
     """Test ToolManager functionality"""
 
-    def test_register_tool(self, mock_vector_store):
+    @pytest.fixture(autouse=True)
+    def reset_shared_sources(self, populated_tool_manager):
+        """Clear sources a test left on the module's shared manager"""
+        yield
+        populated_tool_manager.reset_sources()
+
+    def test_register_tool(self, search_tool):
         """Test tool registration"""
         manager = ToolManager()
-        search_tool = CourseSearchTool(mock_vector_store)
 
         manager.register_tool(search_tool)
 
         assert "search_course_content" in manager.tools
         assert manager.tools["search_course_content"] == search_tool
 
-    def test_get_tool_definitions(self, mock_vector_store):
+    def test_get_tool_definitions(self, populated_tool_manager):
         """Test getting all tool definitions"""
-        manager = ToolManager()
-        search_tool = CourseSearchTool(mock_vector_store)
-        outline_tool = CourseOutlineTool(mock_vector_store)
-
-        manager.register_tool(search_tool)
-        manager.register_tool(outline_tool)
-
-        definitions = manager.get_tool_definitions()
+        definitions = populated_tool_manager.get_tool_definitions()
 
         assert len(definitions) == 2
         tool_names = [d["name"] for d in definitions]
         assert "search_course_content" in tool_names
         assert "get_course_outline" in tool_names
 
-    def test_execute_tool(self, mock_vector_store):
-        """Test tool execution through manager"""
-        manager = ToolManager()
-        search_tool = CourseSearchTool(mock_vector_store)
-        manager.register_tool(search_tool)
+    def test_tool_definitions_cached_and_stable(self, populated_tool_manager):
+        """Test the last definition is cache-marked and the list is reused"""
+        definitions = populated_tool_manager.get_tool_definitions()
+
+        assert definitions[-1]["cache_control"] == {"type": "ephemeral"}
+        assert "cache_control" not in definitions[0]
+        assert populated_tool_manager.get_tool_definitions() is definitions
 
-        result = manager.execute_tool("search_course_content", query="test")
+    def test_execute_tool(self, populated_tool_manager):
+        """Test tool execution through manager"""
+        result = populated_tool_manager.execute_tool(
+            "search_course_content", query="test"
+        )
 
         # Verify the tool was executed
         assert "[Test Course - Lesson 1]" in result
 
-    def test_execute_nonexistent_tool(self, mock_vector_store):
-        """Test execution of non-registered tool"""
-        manager = ToolManager()
+    def test_execute_tool_with_sources(self, populated_tool_manager):
+        """Test per-call execution returns sources without storing them"""
+        result, sources = populated_tool_manager.execute_tool_with_sources(
+            "search_course_content", query="test"
+        )
 
-        result = manager.execute_tool("nonexistent_tool", query="test")
+        assert result == _EXPECTED_SEARCH_OUTPUT
+        assert [s["display"] for s in sources] == [
+            "Test Course - Lesson 1",
+            "Test Course - Lesson 2",
+        ]
+        # Shared tool state is untouched, so concurrent calls can't leak
+        assert populated_tool_manager.get_last_sources() == []
+
+    def test_execute_nonexistent_tool(self, populated_tool_manager):
+        """Test execution of non-registered tool"""
+        result = populated_tool_manager.execute_tool("nonexistent_tool", query="test")
 
         assert "Tool 'nonexistent_tool' not found" in result
 
-    def test_get_last_sources(self, mock_vector_store):
+    def test_get_last_sources(self, populated_tool_manager):
         """Test getting sources from last search"""
-        manager = ToolManager()
-        search_tool = CourseSearchTool(mock_vector_store)
-        manager.register_tool(search_tool)
-
         # Execute search to populate sources
-        manager.execute_tool("search_course_content", query="test")
+        populated_tool_manager.execute_tool("search_course_content", query="test")
 
-        sources = manager.get_last_sources()
+        sources = populated_tool_manager.get_last_sources()
         assert len(sources) == 2
         assert sources[0]["display"] == "Test Course - Lesson 1"
 
-    def test_reset_sources(self, mock_vector_store):
+    def test_reset_sources(self, populated_tool_manager):
         """Test resetting sources from all tools"""
-        manager = ToolManager()
-        search_tool = CourseSearchTool(mock_vector_store)
-        manager.register_tool(search_tool)
-
         # Execute search to populate sources
-        manager.execute_tool("search_course_content", query="test")
-        assert len(manager.get_last_sources()) == 2
+        populated_tool_manager.execute_tool("search_course_content", query="test")
+        assert len(populated_tool_manager.get_last_sources()) == 2
 
         # Reset sources
-        manager.reset_sources()
-        assert len(manager.get_last_sources()) == 0
+        populated_tool_manager.reset_sources()
+        assert len(populated_tool_manager.get_last_sources()) == 0
 
-    def test_register_tool_without_name(self, mock_vector_store):
+    @pytest.mark.slow_under_profile
+    def test_register_tool_without_name(self):
         """Test registering tool without proper name"""
         manager = ToolManager()
 
-        # Create a mock tool with no name in definition
-        mock_tool = Mock()
-        mock_tool.get_tool_definition.return_value = {"description": "test"}
+        # Create a tool with no name in definition
+        mock_tool = _Stub()
 
-        with pytest.raises(ValueError, match="Tool must have a 'name'"):
+        with pytest.raises(ValueError) as excinfo:
             manager.register_tool(mock_tool)
+        assert "Tool must have a 'name'" in str(excinfo.value)